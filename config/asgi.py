@@ -3,6 +3,10 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Telegram webhook (habit_tracker/telegram/webhook/) is an async view, so serve
+the bot traffic through this application (e.g. uvicorn/daphne) to process
+updates concurrently in the worker's event loop.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -142,10 +142,35 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # JSON через orjson (зависимость проекта); BrowsableAPIRenderer и ответы с отступами - стандартным json DRF
+    "DEFAULT_RENDERER_CLASSES": [
+        "habits.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "habits.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 5,
 }
 
+# Максимальный размер страницы, который клиент может запросить через ?page_size= в API привычек
+HABIT_API_MAX_PAGE_SIZE = int(os.getenv("HABIT_API_MAX_PAGE_SIZE", 100))
+
+# Сколько элементов (создание + изменение + удаление) принимает пакетный эндпоинт привычек
+HABIT_BULK_MAX_ITEMS = int(os.getenv("HABIT_BULK_MAX_ITEMS", 500))
+
+# Время жизни закэшированных страниц списка своих привычек (секунды); при изменении привычек сменяется версия
+HABIT_LIST_CACHE_TTL = int(os.getenv("HABIT_LIST_CACHE_TTL", 60 * 5))
+
+# Время жизни закэшированной публичной ленты привычек (секунды); при изменении привычек она сбрасывается сразу
+PUBLIC_FEED_CACHE_TTL = int(os.getenv("PUBLIC_FEED_CACHE_TTL", 60 * 5))
+# Сколько первых привычек публичной ленты держать в кэше (глубже страницы читаются из БД) и по сколько в одном ключе
+PUBLIC_FEED_CACHE_SIZE = int(os.getenv("PUBLIC_FEED_CACHE_SIZE", 1000))
+PUBLIC_FEED_CHUNK_SIZE = int(os.getenv("PUBLIC_FEED_CHUNK_SIZE", 100))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -204,6 +229,24 @@ CACHES = {
     }
 }
 
+# Тесты не зависят от Redis: кэш в памяти процесса
+if "test" in sys.argv or "test_coverage" in sys.argv:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "habits": {
+            "handlers": ["console"],
+            "level": os.getenv("HABITS_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60 * 2),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -224,6 +267,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "habits.tasks.check_and_send_habit_reminders",
         "schedule": 60.0,  # Каждую минуту (60 секунд)
     },
+    "cleanup-reminder-deliveries-every-day": {
+        "task": "habits.tasks.cleanup_reminder_deliveries",
+        "schedule": 60.0 * 60 * 24,  # Раз в сутки
+    },
     "debug-task-every-5-minutes": {
         "task": "habits.tasks.debug_task",
         "schedule": 300.0,  # Каждые 5 минут для тестирования
@@ -231,6 +278,50 @@ CELERY_BEAT_SCHEDULE = {
 }
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Режим webhook: публичный URL эндпоинта habit_tracker/telegram/webhook/ и секрет для проверки запросов
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+
+# Пул HTTP-соединений к Telegram API (общий для процесса воркера)
+TELEGRAM_HTTP_POOL_SIZE = int(os.getenv("TELEGRAM_HTTP_POOL_SIZE", 10))
+TELEGRAM_HTTP_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_HTTP_CONNECT_TIMEOUT", 5))
+TELEGRAM_HTTP_READ_TIMEOUT = float(os.getenv("TELEGRAM_HTTP_READ_TIMEOUT", 10))
+
+# Пакетная асинхронная отправка: параллельные запросы и лимиты Telegram (сообщений в секунду).
+# Глобальный лимит действует в пределах процесса воркера: при нескольких воркерах делите его между ними
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", 10))
+TELEGRAM_GLOBAL_RATE_LIMIT = float(os.getenv("TELEGRAM_GLOBAL_RATE_LIMIT", 30))
+TELEGRAM_CHAT_RATE_LIMIT = float(os.getenv("TELEGRAM_CHAT_RATE_LIMIT", 1))
+
+# Метрики доставки напоминаний в statsd (UDP); без STATSD_HOST метрики всех процессов - в habit_tracker/api/metrics/
+STATSD_HOST = os.getenv("STATSD_HOST")
+STATSD_PORT = int(os.getenv("STATSD_PORT", 8125))
+STATSD_PREFIX = os.getenv("STATSD_PREFIX", "habit_tracker")
+# Как часто (в секундах) процесс сбрасывает накопленные метрики в общее хранилище (Redis)
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 10))
+# Токен для сбора метрик Prometheus (заголовок Authorization: Bearer <токен>); без него метрики видит только персонал
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Сколько готовых текстов сообщений о привычках держать в памяти процесса
+HABIT_RENDER_CACHE_SIZE = int(os.getenv("HABIT_RENDER_CACHE_SIZE", 10000))
+
+# Сколько обновлений Telegram-бот обрабатывает одновременно в режиме polling
+# (у каждого обновления свой поток и соединение с базой, поэтому значение ограничено max_connections PostgreSQL)
+TELEGRAM_BOT_CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_BOT_CONCURRENT_UPDATES", 32))
+
+# Сколько привычек показывает одна страница /my_habits в боте (страница должна укладываться в 4096 символов)
+TELEGRAM_HABITS_PAGE_SIZE = int(os.getenv("TELEGRAM_HABITS_PAGE_SIZE", 5))
+
+# Кэш chat_id → пользователь в Telegram-боте: TTL в памяти процесса и в общем кэше (секунды)
+TELEGRAM_CHAT_CACHE_LOCAL_TTL = int(os.getenv("TELEGRAM_CHAT_CACHE_LOCAL_TTL", 30))
+TELEGRAM_CHAT_CACHE_TTL = int(os.getenv("TELEGRAM_CHAT_CACHE_TTL", 60 * 15))
+# Как часто (в секундах) процесс сверяет версию кэша, чтобы увидеть сброс, сделанный другим процессом
+TELEGRAM_CHAT_CACHE_VERSION_CHECK_INTERVAL = float(os.getenv("TELEGRAM_CHAT_CACHE_VERSION_CHECK_INTERVAL", 1))
+
+# Сколько напоминаний отправляет одна задача-исполнитель планировщика
+HABIT_REMINDER_BATCH_SIZE = int(os.getenv("HABIT_REMINDER_BATCH_SIZE", 100))
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWED_ORIGINS = [
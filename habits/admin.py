@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Habit
+from .models import Habit, ReminderDelivery
 
 
 @admin.register(Habit)
@@ -9,3 +9,14 @@ class HabitAdmin(admin.ModelAdmin):
     list_filter = ("is_pleasant", "is_public", "frequency")
     search_fields = ("action", "place", "user__username")
     readonly_fields = ("created_at", "updated_at")
+
+    def save_model(self, request, obj, form, change):
+        # Форма уже вызвала full_clean - повторная полная проверка в Habit.save не нужна
+        obj.save(validated=True)
+
+
+@admin.register(ReminderDelivery)
+class ReminderDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("habit", "scheduled_date", "scheduled_minute", "is_sent", "created_at")
+    list_filter = ("is_sent", "scheduled_date")
+    readonly_fields = ("claim_token", "created_at")
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+CHAT_USER_CACHE_KEY = "telegram_chat_user:{chat_id}"
+# Версия кэша: меняется при каждом сбросе, по ней процессы узнают, что их записи в памяти устарели
+CHAT_USER_VERSION_KEY = "telegram_chat_user_version"
+
+# Данные пользователя, которых боту достаточно для обработки команд
+ChatUser = namedtuple("ChatUser", ("id", "username", "telegram_notifications"))
+
+
+def _chat_user_queryset(chat_id):
+    return get_user_model().objects.filter(telegram_chat_id=chat_id).values_list(*ChatUser._fields)
+
+
+class ChatUserCache:
+    """
+    Двухуровневый кэш chat_id → пользователь: словарь в памяти процесса с коротким TTL поверх общего кэша Django.
+    Непривязанные chat_id тоже кэшируются, чтобы повторные сообщения с email не ходили в базу.
+    Сброс меняет версию в общем кэше; процесс сверяет ее не реже раза в version_check_interval секунд
+    (вместе с очередным запросом к общему кэшу), поэтому другие процессы видят сброс с задержкой не больше интервала.
+    """
+
+    def __init__(self, local_ttl, shared_ttl, version_check_interval):
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.version_check_interval = version_check_interval
+        self._items = {}
+        self._version = None
+        self._version_checked_at = None
+        self._lock = threading.Lock()
+
+    def get_local(self, chat_id):
+        """
+        Поиск только в памяти процесса: (найдено, пользователь или None).
+        Когда версию пора сверить, память процесса не используется - запрос идет в общий кэш.
+        """
+        with self._lock:
+            if (
+                self._version_checked_at is None
+                or time.monotonic() - self._version_checked_at >= self.version_check_interval
+            ):
+                return False, None
+            item = self._items.get(chat_id)
+            if item is None:
+                return False, None
+            expires_at, user = item
+            if expires_at < time.monotonic():
+                del self._items[chat_id]
+                return False, None
+            return True, user
+
+    def get(self, chat_id):
+        """Поиск в памяти процесса, затем в общем кэше, затем в базе"""
+        found, user = self.get_local(chat_id)
+        if found:
+            return user
+
+        key = CHAT_USER_CACHE_KEY.format(chat_id=chat_id)
+        values = cache.get_many([key, CHAT_USER_VERSION_KEY])
+        self._check_version(values.get(CHAT_USER_VERSION_KEY))
+        cached = values.get(key)
+        if cached is None:
+            values = _chat_user_queryset(chat_id).first()
+            cached = tuple(values) if values else ()
+            cache.set(key, cached, self.shared_ttl)
+
+        return self._set_local(chat_id, cached)
+
+    async def aget(self, chat_id):
+        """Асинхронный вариант get для Telegram-бота"""
+        found, user = self.get_local(chat_id)
+        if found:
+            return user
+
+        key = CHAT_USER_CACHE_KEY.format(chat_id=chat_id)
+        values = await cache.aget_many([key, CHAT_USER_VERSION_KEY])
+        self._check_version(values.get(CHAT_USER_VERSION_KEY))
+        cached = values.get(key)
+        if cached is None:
+            values = await _chat_user_queryset(chat_id).afirst()
+            cached = tuple(values) if values else ()
+            await cache.aset(key, cached, self.shared_ttl)
+
+        return self._set_local(chat_id, cached)
+
+    def _check_version(self, version):
+        """Записи в памяти, сделанные до сброса в любом процессе, больше не используются"""
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+            self._version_checked_at = time.monotonic()
+
+    def _set_local(self, chat_id, cached):
+        user = ChatUser(*cached) if cached else None
+        with self._lock:
+            self._items[chat_id] = (time.monotonic() + self.local_ttl, user)
+        return user
+
+    def invalidate(self, *chat_ids):
+        """Сброс записей во всех процессах (вызывается при сохранении пользователя)"""
+        chat_ids = [chat_id for chat_id in chat_ids if chat_id is not None]
+        if not chat_ids:
+            return
+
+        with self._lock:
+            for chat_id in chat_ids:
+                self._items.pop(chat_id, None)
+        cache.delete_many([CHAT_USER_CACHE_KEY.format(chat_id=chat_id) for chat_id in chat_ids])
+        try:
+            cache.incr(CHAT_USER_VERSION_KEY)
+        except ValueError:
+            cache.add(CHAT_USER_VERSION_KEY, time.time_ns(), timeout=None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+chat_user_cache = ChatUserCache(
+    settings.TELEGRAM_CHAT_CACHE_LOCAL_TTL,
+    settings.TELEGRAM_CHAT_CACHE_TTL,
+    settings.TELEGRAM_CHAT_CACHE_VERSION_CHECK_INTERVAL,
+)
@@ -0,0 +1,20 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+def make_etag(*parts):
+    """Сильный ETag из версии ресурса (updated_at, версия списка и т.п.) - без сериализации ответа"""
+    return quote_etag(hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest())
+
+
+def get_not_modified_response(request, etag):
+    """304 Not Modified, если If-None-Match запроса совпадает с etag; иначе None"""
+    if request.method not in ("GET", "HEAD"):
+        return None
+
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+    return response
@@ -0,0 +1,14 @@
+from rest_framework.filters import OrderingFilter
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    Сортировка по ?ordering= с id в конце: курсорная пагинация по неуникальному полю (time, place...)
+    без него пропускала бы и повторяла привычки с одинаковым значением на границе страниц.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            return ordering
+        return (*ordering, "-id" if ordering[0].startswith("-") else "id")
@@ -0,0 +1,51 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+HABIT_LIST_VERSION_KEY = "habit_list_version:{user_id}"
+HABIT_LIST_CACHE_KEY = "habit_list:{user_id}:{version}:{params}"
+
+
+def get_habit_list_version(user_id):
+    """
+    Версия списка привычек пользователя. Ключ версии хранится без срока жизни; если его все же вытеснили,
+    новая версия берется от текущего времени, чтобы не совпасть со старыми закэшированными ответами.
+    """
+    key = HABIT_LIST_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_habit_list_version(user_id):
+    """Инвалидация всех закэшированных страниц пользователя за O(1): старые ключи просто перестают читаться"""
+
+    def bump():
+        key = HABIT_LIST_VERSION_KEY.format(user_id=user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_habit_list_cache_key(request):
+    """Ключ ответа: пользователь, версия его списка и все параметры запроса (фильтры, сортировка, курсор, хост)"""
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(repr((request.get_host(), params)).encode(), usedforsecurity=False).hexdigest()
+    version = get_habit_list_version(request.user.id)
+    return HABIT_LIST_CACHE_KEY.format(user_id=request.user.id, version=version, params=digest)
+
+
+def get_cached_habit_list(key):
+    return cache.get(key)
+
+
+def set_cached_habit_list(key, data):
+    cache.set(key, data, settings.HABIT_LIST_CACHE_TTL)
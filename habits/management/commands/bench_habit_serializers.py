@@ -0,0 +1,105 @@
+import time
+from datetime import time as habit_time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from habits.models import Habit
+from habits.serializers import HabitRowSerializer, HabitSerializer, PublicHabitRowSerializer, PublicHabitSerializer
+
+User = get_user_model()
+
+BENCH_USERNAME_PREFIX = "bench_serializer_"
+
+
+class RollbackBenchmark(Exception):
+    """Откат данных бенчмарка после прогона"""
+
+
+def measure(serialize, repeat):
+    """Лучшее время из repeat прогонов: запрос к БД + сериализация всех строк"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Скорость сериализации списков привычек: ModelSerializer против быстрых сериализаторов по строкам values()"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000, help="Количество привычек")
+        parser.add_argument("--users", type=int, default=100, help="Количество авторов публичных привычек")
+        parser.add_argument("--repeat", type=int, default=3, help="Количество прогонов каждого варианта")
+
+    def handle(self, *args, **options):
+        try:
+            # Тестовые привычки живут внутри транзакции и откатываются в конце
+            with transaction.atomic():
+                results = self.run_benchmark(options["rows"], options["users"], options["repeat"])
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            pass
+
+        self.stdout.write(f"Привычек: {options['rows']}, авторов: {options['users']}, лучший из {options['repeat']}")
+        for name, current, fast in results:
+            self.stdout.write(f"{name}:")
+            self.stdout.write(f"  ModelSerializer: {options['rows'] / current:,.0f} строк/с")
+            self.stdout.write(f"  По строкам:      {options['rows'] / fast:,.0f} строк/с")
+            self.stdout.write(self.style.SUCCESS(f"  Ускорение: x{current / fast:.2f}"))
+
+    def run_benchmark(self, rows, users, repeat):
+        authors = User.objects.bulk_create(
+            User(username=f"{BENCH_USERNAME_PREFIX}{i}", email=f"{BENCH_USERNAME_PREFIX}{i}@example.com")
+            for i in range(users)
+        )
+        Habit.objects.bulk_create(
+            (
+                Habit(
+                    user=authors[i % users],
+                    place="Дом",
+                    time=habit_time(i % 24, i % 60),
+                    action=f"Привычка {i}",
+                    duration=60,
+                    is_public=True,
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000,
+        )
+        queryset = Habit.objects.filter(user__username__startswith=BENCH_USERNAME_PREFIX).order_by(
+            "-created_at", "-id"
+        )
+
+        # Форматы ответов должны совпадать, иначе сравнение бессмысленно
+        sample = queryset[:10]
+        if (
+            HabitSerializer(sample, many=True).data
+            != HabitRowSerializer(HabitRowSerializer.get_rows(sample), many=True).data
+        ):
+            raise CommandError("HabitRowSerializer отдает не тот же формат, что HabitSerializer")
+        if (
+            PublicHabitSerializer(sample, many=True).data
+            != PublicHabitRowSerializer(PublicHabitRowSerializer.get_rows(sample), many=True).data
+        ):
+            raise CommandError("PublicHabitRowSerializer отдает не тот же формат, что PublicHabitSerializer")
+
+        return [
+            (
+                "Свои привычки (HabitSerializer)",
+                measure(lambda: HabitSerializer(queryset.all(), many=True).data, repeat),
+                measure(lambda: HabitRowSerializer(HabitRowSerializer.get_rows(queryset), many=True).data, repeat),
+            ),
+            (
+                "Публичные привычки (PublicHabitSerializer, автор загружается на каждую строку)",
+                measure(lambda: PublicHabitSerializer(queryset.all(), many=True).data, repeat),
+                measure(
+                    lambda: PublicHabitRowSerializer(PublicHabitRowSerializer.get_rows(queryset), many=True).data,
+                    repeat,
+                ),
+            ),
+        ]
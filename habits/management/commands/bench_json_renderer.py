@@ -0,0 +1,103 @@
+import io
+import json
+import time
+from datetime import datetime
+from datetime import time as habit_time
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from habits.renderers import FastJSONParser, FastJSONRenderer, orjson
+from habits.serializers import HabitRowSerializer, PublicHabitRowSerializer
+
+
+def make_rows(count):
+    """Строки привычек в виде values() без обращения к БД"""
+    created_at = datetime(2025, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+    return [
+        {
+            "id": i,
+            "user_id": i % 100,
+            "username": f"user_{i % 100}",
+            "place": "Дом",
+            "time": habit_time(i % 24, i % 60),
+            "action": f"Привычка {i}",
+            "is_pleasant": False,
+            "related_habit_id": None,
+            "reward": "Чашка кофе ☕",
+            "frequency": 1,
+            "duration": 60,
+            "is_public": True,
+            "created_at": created_at + timedelta(seconds=i),
+            "updated_at": created_at + timedelta(seconds=i, microseconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def make_page(results):
+    """Страница курсорной пагинации, как ее отдает API"""
+    return {
+        "next": "http://testserver/habit_tracker/api/habits/?cursor=cD0yMDI1",
+        "previous": None,
+        "results": results,
+    }
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Сравнение JSONRenderer/JSONParser DRF и orjson-версий на страницах списков привычек"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000, help="Количество привычек в ответе")
+        parser.add_argument("--repeat", type=int, default=5, help="Количество прогонов каждого варианта")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson не установлен: FastJSONRenderer работает как стандартный JSONRenderer")
+
+        rows = make_rows(options["rows"])
+        payloads = [
+            ("Свои привычки (HabitRowSerializer)", make_page(HabitRowSerializer(rows, many=True).data)),
+            (
+                "Публичные привычки (PublicHabitRowSerializer)",
+                make_page(PublicHabitRowSerializer(rows, many=True).data),
+            ),
+            # datetime, time и Decimal без предварительного перевода в строки сериализатором
+            ("Сырые строки values() + Decimal", make_page([{**row, "score": Decimal("4.50")} for row in rows])),
+        ]
+
+        self.stdout.write(f"Привычек в ответе: {options['rows']}, лучший из {options['repeat']}")
+        for name, payload in payloads:
+            current_bytes = JSONRenderer().render(payload)
+            fast_bytes = FastJSONRenderer().render(payload)
+            if json.loads(current_bytes) != json.loads(fast_bytes):
+                raise CommandError(f"{name}: FastJSONRenderer отдает другой JSON, чем JSONRenderer")
+
+            render_current = measure(lambda: JSONRenderer().render(payload), options["repeat"])
+            render_fast = measure(lambda: FastJSONRenderer().render(payload), options["repeat"])
+            parse_current = measure(lambda: JSONParser().parse(io.BytesIO(current_bytes)), options["repeat"])
+            parse_fast = measure(lambda: FastJSONParser().parse(io.BytesIO(current_bytes)), options["repeat"])
+
+            self.stdout.write(f"{name} ({len(current_bytes) / 1024:.0f} КБ):")
+            self.stdout.write(
+                f"  Рендеринг: {render_current * 1000:.1f} мс -> {render_fast * 1000:.1f} мс "
+                f"(x{render_current / render_fast:.2f})"
+            )
+            self.stdout.write(
+                f"  Разбор:    {parse_current * 1000:.1f} мс -> {parse_fast * 1000:.1f} мс "
+                f"(x{parse_current / parse_fast:.2f})"
+            )
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from telegram import Update
+
+from habits.chat_cache import chat_user_cache
+from habits.management.commands.bench_telegram_sender import run_stub_server
+from habits.telegram_bot import HabitTrackerBot
+
+User = get_user_model()
+
+BENCH_USERNAME_PREFIX = "bench_bot_"
+BENCH_CHAT_ID_OFFSET = 9_000_000_000
+
+
+def make_command_update(update_id, chat_id, command):
+    """Фейковое обновление Telegram с командой от пользователя"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Benchmark"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Пропускная способность Telegram-бота: последовательная и конкурентная обработка фейковых обновлений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--updates", type=int, default=200, help="Количество обновлений (и чатов) в прогоне")
+        parser.add_argument("--latency", type=float, default=20, help="Задержка ответа заглушки в миллисекундах")
+        parser.add_argument("--command", default="/my_habits", help="Команда в фейковых обновлениях")
+
+    def handle(self, *args, **options):
+        count = options["updates"]
+
+        port_queue = multiprocessing.Queue()
+        server = multiprocessing.Process(
+            target=run_stub_server, args=(port_queue, options["latency"] / 1000), daemon=True
+        )
+        server.start()
+        api_url = f"http://127.0.0.1:{port_queue.get()}"
+
+        # Пользователи бенчмарка создаются в отдельной тестовой базе, которая удаляется после прогона.
+        # Откат транзакции не подходит: конкурентные обработчики ходят в базу из своих потоков и соединений
+        # и не видят незафиксированных данных
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            User.objects.bulk_create(
+                User(
+                    username=f"{BENCH_USERNAME_PREFIX}{i}",
+                    email=f"{BENCH_USERNAME_PREFIX}{i}@example.com",
+                    telegram_chat_id=BENCH_CHAT_ID_OFFSET + i,
+                )
+                for i in range(count)
+            )
+            with override_settings(TELEGRAM_API_URL=api_url, TELEGRAM_BOT_TOKEN="benchmark"):
+                sequential, concurrent = asyncio.run(self.run_benchmark(count, options["command"]))
+        finally:
+            server.terminate()
+            chat_user_cache.clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"Обновлений: {count} ({options['command']}), задержка заглушки: {options['latency']} мс")
+        self.stdout.write(f"Последовательно: {count / sequential:.1f} обновлений/с")
+        self.stdout.write(f"Конкурентно:     {count / concurrent:.1f} обновлений/с")
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: x{sequential / concurrent:.2f}"))
+
+    async def run_benchmark(self, count, command):
+        bot = HabitTrackerBot()
+        application = bot.application
+
+        def make_updates(offset):
+            return [
+                Update.de_json(make_command_update(offset + i, chat_id, command), application.bot)
+                for i, chat_id in enumerate(chat_ids)
+            ]
+
+        chat_ids = [BENCH_CHAT_ID_OFFSET + i for i in range(count)]
+
+        async with application:
+            # Кэш chat_id сбрасывается перед каждым прогоном, чтобы мерить обращения к базе, а не к памяти
+            chat_user_cache.invalidate(*chat_ids)
+            updates = make_updates(0)
+            started = time.perf_counter()
+            for update in updates:
+                await self.process(application, update)
+            sequential = time.perf_counter() - started
+
+            chat_user_cache.invalidate(*chat_ids)
+            updates = make_updates(count)
+            started = time.perf_counter()
+            await asyncio.gather(*(self.process(application, update) for update in updates))
+            concurrent = time.perf_counter() - started
+
+        return sequential, concurrent
+
+    @staticmethod
+    async def process(application, update):
+        """Обработка тем же путем, что и в режиме polling: через update_processor приложения"""
+        await application.update_processor.process_update(update, application.process_update(update))
@@ -0,0 +1,118 @@
+import json
+import multiprocessing
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from habits.telegram_client import (
+    get_api_url,
+    get_telegram_session,
+    get_timeout,
+    reset_telegram_async_client,
+    reset_telegram_session,
+    send_messages_bulk_sync
+)
+
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    """Заглушка Telegram Bot API: на getMe отвечает данными бота, на остальные запросы - успешным sendMessage"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+
+        if self.path.endswith("/getMe"):
+            result = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        else:
+            result = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}}
+
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTelegramServer(ThreadingHTTPServer):
+    # Очередь соединений с запасом: клиенты открывают сотни соединений одновременно
+    request_queue_size = 1024
+
+
+def run_stub_server(port_queue, latency):
+    """Запуск заглушки в отдельном процессе, чтобы сервер не делил GIL с клиентом"""
+    StubTelegramHandler.latency = latency
+    server = StubTelegramServer(("127.0.0.1", 0), StubTelegramHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class Command(BaseCommand):
+    help = "Сравнение задержки отправки в Telegram: новое соединение, пул keep-alive и пакетная async отправка"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500, help="Количество сообщений в каждом прогоне")
+        parser.add_argument("--latency", type=float, default=0, help="Задержка ответа заглушки в миллисекундах")
+
+    def handle(self, *args, **options):
+        count = options["messages"]
+
+        port_queue = multiprocessing.Queue()
+        server = multiprocessing.Process(
+            target=run_stub_server, args=(port_queue, options["latency"] / 1000), daemon=True
+        )
+        server.start()
+        api_url = f"http://127.0.0.1:{port_queue.get()}"
+        payload = {"chat_id": 1, "text": "benchmark", "parse_mode": "HTML"}
+
+        try:
+            with override_settings(TELEGRAM_API_URL=api_url, TELEGRAM_BOT_TOKEN="benchmark"):
+                url = get_api_url("sendMessage")
+
+                # Старый вариант: requests.post открывает новое соединение на каждое сообщение
+                started = time.perf_counter()
+                for _ in range(count):
+                    requests.post(url, json=payload, timeout=get_timeout())
+                unpooled = (time.perf_counter() - started) / count
+
+                # Новый вариант: общая сессия с пулом соединений
+                reset_telegram_session()
+                session = get_telegram_session()
+                started = time.perf_counter()
+                for _ in range(count):
+                    session.post(url, json=payload, timeout=get_timeout())
+                pooled = (time.perf_counter() - started) / count
+
+            # Пакетная асинхронная отправка (лимиты Telegram сняты, чтобы мерить сам клиент)
+            with override_settings(
+                TELEGRAM_API_URL=api_url,
+                TELEGRAM_BOT_TOKEN="benchmark",
+                TELEGRAM_GLOBAL_RATE_LIMIT=count,
+                TELEGRAM_CHAT_RATE_LIMIT=count,
+            ):
+                started = time.perf_counter()
+                results = send_messages_bulk_sync([(chat_id, "benchmark") for chat_id in range(count)])
+                bulk = (time.perf_counter() - started) / count
+                delivered = sum(result["ok"] for result in results)
+        finally:
+            reset_telegram_async_client()
+            server.terminate()
+            reset_telegram_session()
+
+        self.stdout.write(f"Сообщений в прогоне: {count}, задержка заглушки: {options['latency']} мс")
+        self.stdout.write(f"Без пула: {unpooled * 1000:.3f} мс/сообщение")
+        self.stdout.write(f"С пулом:  {pooled * 1000:.3f} мс/сообщение")
+        self.stdout.write(f"Пакетом (async, доставлено {delivered}): {bulk * 1000:.3f} мс/сообщение")
+        self.stdout.write(
+            self.style.SUCCESS(f"Ускорение пула: x{unpooled / pooled:.2f}, пакета: x{unpooled / bulk:.2f}")
+        )
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from habits.models import Habit
+
+
+def get_hot_queries(user_id):
+    """Горячие запросы к привычкам и индексы, которые должен выбрать для них планировщик БД"""
+    now = timezone.now()
+    return [
+        (
+            "API: список своих привычек",
+            Habit.objects.filter(user_id=user_id).order_by("-created_at", "-id")[:6],
+            ["habit_user_created_at_id_idx"],
+        ),
+        (
+            "HTML: свои полезные привычки",
+            Habit.objects.filter(user_id=user_id, is_pleasant=False).order_by("-created_at")[:6],
+            ["habit_user_pleasant_idx", "habit_user_useful_id_idx", "habit_user_created_at_id_idx"],
+        ),
+        (
+            "Бот: страница /my_habits",
+            Habit.objects.filter(user_id=user_id, is_pleasant=False, id__gt=0).order_by("id")[:6],
+            ["habit_user_useful_id_idx"],
+        ),
+        (
+            "API: публичная лента",
+            Habit.objects.filter(is_public=True).exclude(user_id=user_id).order_by("-created_at", "-id")[:6],
+            ["habit_public_created_at_idx"],
+        ),
+        (
+            "Планировщик напоминаний",
+            Habit.objects.filter(
+                next_due_at__lte=now, user__telegram_chat_id__isnull=False, user__telegram_notifications=True
+            )
+            .select_related("user")
+            .order_by(),
+            ["next_due_at"],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Проверка через EXPLAIN, что горячие запросы к привычкам используют индексы (PostgreSQL и SQLite)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="Печатать планы запросов целиком")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ("postgresql", "sqlite"):
+            raise CommandError(f"EXPLAIN-проверка поддерживает PostgreSQL и SQLite, а не {connection.vendor}")
+
+        failed = []
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # На маленьких таблицах PostgreSQL честно выбирает seq scan - проверяем, что индекс вообще применим
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for name, queryset, expected_indexes in get_hot_queries(user_id=1):
+                plan = queryset.explain()
+                used = [index for index in expected_indexes if index in plan]
+
+                if used:
+                    self.stdout.write(self.style.SUCCESS(f"✅ {name}: {used[0]}"))
+                else:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(f"❌ {name}: ожидался один из индексов {expected_indexes}"))
+
+                if options["verbose_plans"] or not used:
+                    self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(f"Запросы без индекса: {', '.join(failed)}")
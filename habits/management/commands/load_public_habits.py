@@ -65,7 +65,8 @@ class Command(BaseCommand):
         ]
 
         for data in pleasant_data:
-            habit = Habit.objects.create(user=user, **data, is_public=True)
+            habit = Habit(user=user, **data, is_public=True)
+            habit.save(validated=True)
             pleasant_habits.append(habit)
             self.stdout.write(f"Создана приятная привычка: {habit.action}")
 
@@ -209,9 +210,8 @@ class Command(BaseCommand):
                 habit_data["reward"] = data["reward"]
                 habit_data["related_habit"] = None  # ✅ Явно убираем related_habit при наличии reward
 
-            habit = Habit.objects.create(**habit_data)
-
-            habit = Habit.objects.create(**habit_data)
+            habit = Habit(**habit_data)
+            habit.save(validated=True)
             created_count += 1
             self.stdout.write(f"Создана полезная привычка: {habit.action}")
 
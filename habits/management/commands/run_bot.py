@@ -1,7 +1,8 @@
 import asyncio
 import logging
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
 from habits.telegram_bot import HabitTrackerBot
 
@@ -11,7 +12,18 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = "Запуск Telegram бота для трекера привычек"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--webhook",
+            action="store_true",
+            help="Зарегистрировать webhook (TELEGRAM_WEBHOOK_URL) вместо запуска polling",
+        )
+
     def handle(self, *args, **options):
+        if options["webhook"]:
+            self.set_webhook()
+            return
+
         self.stdout.write("Starting Telegram bot...")
 
         try:
@@ -29,3 +41,11 @@ class Command(BaseCommand):
         except Exception as e:
             logger.error(f"Bot error: {e}")
             self.stdout.write(self.style.ERROR(f"Bot error: {e}"))
+
+    def set_webhook(self):
+        """Переключение бота в режим webhook: обновления обрабатывает веб-приложение (TelegramWebhookView)"""
+        if not settings.TELEGRAM_WEBHOOK_URL or not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise CommandError("TELEGRAM_WEBHOOK_URL и TELEGRAM_WEBHOOK_SECRET должны быть заданы")
+
+        asyncio.run(HabitTrackerBot().set_webhook(settings.TELEGRAM_WEBHOOK_URL))
+        self.stdout.write(self.style.SUCCESS(f"✅ Webhook установлен: {settings.TELEGRAM_WEBHOOK_URL}"))
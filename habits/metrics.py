@@ -0,0 +1,229 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек (в секундах)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Ключ общего хранилища метрик (hash в Redis), куда процессы web и Celery сбрасывают свои приращения
+METRICS_CACHE_KEY = "metrics"
+
+
+class MetricsRegistry:
+    """
+    Метрики горячего пути: счетчики и гистограммы с метками.
+    Приращения копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд (и после каждой Celery задачи)
+    сбрасываются в общее хранилище, поэтому render_prometheus видит метрики всех процессов web и Celery.
+    Внутри event loop сброс выполняется в пуле потоков loop, не блокируя его.
+    При заданном STATSD_HOST метрики дублируются в statsd по UDP (без блокировки и без ожидания ответа).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._socket = None
+        self.reset()
+
+    def reset(self):
+        """Сброс несохраненных приращений процесса (после fork они принадлежат родителю)"""
+        with self._lock:
+            self.counters = defaultdict(float)
+            self.histograms = {}
+            self._flushed_at = time.monotonic()
+            if self._socket is not None:
+                self._socket.close()
+            self._socket = None
+
+    def inc(self, name, value=1, **labels):
+        """Увеличить счетчик"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+        self._send_statsd(name, labels, f"{value}|c")
+        self._flush_if_due()
+
+    def observe(self, name, value, **labels):
+        """Добавить наблюдение в гистограмму"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0, "count": 0})
+            index = bisect_left(LATENCY_BUCKETS, value)
+            if index < len(LATENCY_BUCKETS):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+        self._send_statsd(name, labels, f"{value * 1000:.3f}|ms")
+        self._flush_if_due()
+
+    def flush(self):
+        """Сброс накопленных приращений процесса в общее хранилище"""
+        with self._lock:
+            counters, histograms = self.counters, self.histograms
+            self.counters, self.histograms = defaultdict(float), {}
+            self._flushed_at = time.monotonic()
+
+        increments = {}
+        for (name, labels), value in counters.items():
+            increments[_encode_field("counter", name, labels, "value")] = value
+        for (name, labels), histogram in histograms.items():
+            for index, count in enumerate(histogram["buckets"]):
+                if count:
+                    increments[_encode_field("histogram", name, labels, index)] = count
+            increments[_encode_field("histogram", name, labels, "sum")] = histogram["sum"]
+            increments[_encode_field("histogram", name, labels, "count")] = histogram["count"]
+
+        if not increments:
+            return
+        try:
+            metrics_store.increment(increments)
+        except Exception as e:
+            # Метрики не должны ломать отправку напоминаний: приращения этого сброса теряются
+            logger.debug(f"⚠️ Не удалось сохранить метрики: {e.__class__.__name__}")
+
+    def render_prometheus(self):
+        """Метрики всех процессов в текстовом формате Prometheus"""
+        self.flush()
+
+        counters = {}
+        histograms = {}
+        for field, value in metrics_store.read().items():
+            kind, name, labels, part = json.loads(field)
+            key = (name, tuple(tuple(label) for label in labels))
+            if kind == "counter":
+                counters[key] = value
+                continue
+            histogram = histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0, "count": 0})
+            if part in ("sum", "count"):
+                histogram[part] = value
+            elif part < len(LATENCY_BUCKETS):
+                histogram["buckets"][part] = value
+
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative:g}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']:g}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def _flush_if_due(self):
+        with self._lock:
+            if time.monotonic() - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+                return
+            self._flushed_at = time.monotonic()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+        else:
+            # В цикле пакетной отправки и бота синхронный запрос к Redis остановил бы все корутины
+            loop.run_in_executor(None, self.flush)
+
+    def _send_statsd(self, name, labels, value):
+        if not settings.STATSD_HOST:
+            return
+
+        metric = ".".join([settings.STATSD_PREFIX, name, *(str(label) for _, label in sorted(labels.items()))])
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.sendto(f"{metric}:{value}".encode(), (settings.STATSD_HOST, settings.STATSD_PORT))
+        except OSError:
+            # Метрики не должны ломать отправку напоминаний
+            pass
+
+
+class MetricsStore:
+    """
+    Общее хранилище метрик: hash в Redis (кэш django_redis), приращения - атомарным HINCRBYFLOAT.
+    Без Redis (локальный кэш в тестах и разработке) - словарь в кэше Django, общий только в пределах процесса.
+    """
+
+    def _get_redis(self):
+        try:
+            from django_redis import get_redis_connection
+
+            return get_redis_connection("default")
+        except (ImportError, NotImplementedError):
+            return None
+
+    def increment(self, increments):
+        redis = self._get_redis()
+        key = cache.make_key(METRICS_CACHE_KEY)
+        if redis is None:
+            data = cache.get(METRICS_CACHE_KEY, {})
+            for field, value in increments.items():
+                data[field] = data.get(field, 0) + value
+            cache.set(METRICS_CACHE_KEY, data, timeout=None)
+            return
+
+        pipeline = redis.pipeline(transaction=False)
+        for field, value in increments.items():
+            pipeline.hincrbyfloat(key, field, value)
+        pipeline.execute()
+
+    def read(self):
+        redis = self._get_redis()
+        if redis is None:
+            return cache.get(METRICS_CACHE_KEY, {})
+        return {
+            field.decode(): float(value) for field, value in redis.hgetall(cache.make_key(METRICS_CACHE_KEY)).items()
+        }
+
+    def clear(self):
+        redis = self._get_redis()
+        if redis is None:
+            cache.delete(METRICS_CACHE_KEY)
+        else:
+            redis.delete(cache.make_key(METRICS_CACHE_KEY))
+
+
+def _encode_field(kind, name, labels, part):
+    return json.dumps([kind, name, labels, part], ensure_ascii=False)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics_store = MetricsStore()
+metrics = MetricsRegistry()
+
+os.register_at_fork(after_in_child=metrics.reset)
+atexit.register(metrics.flush)
+
+
+def record_telegram_response(status_code, latency):
+    """Метрики одного запроса к Telegram API (status_code=None - сетевая ошибка)"""
+    metrics.inc("telegram_requests_total", code=str(status_code) if status_code else "network_error")
+    metrics.observe("telegram_request_duration_seconds", latency)
+
+
+def record_message_outcome(outcome):
+    """Итог отправки одного сообщения: sent, throttled или failed"""
+    metrics.inc("telegram_messages_total", outcome=outcome)
+
+
+def record_cache_lookup(name, hit):
+    """Обращение к кэшу ответов: доля попаданий = hit / (hit + miss)"""
+    metrics.inc("habit_cache_requests_total", cache=name, result="hit" if hit else "miss")
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.6 on 2025-10-18 15:03
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_next_due_at(apps, schema_editor):
+    """Планируем ближайшее напоминание для уже существующих привычек"""
+    Habit = apps.get_model("habits", "Habit")
+    now = timezone.now()
+    habits = list(Habit.objects.select_related("user").only("id", "time", "user__timezone"))
+    for habit in habits:
+        tz = ZoneInfo(habit.user.timezone)
+        due_at = datetime.combine(now.astimezone(tz).date(), habit.time, tzinfo=tz)
+        if due_at <= now:
+            due_at = datetime.combine(due_at.date() + timedelta(days=1), habit.time, tzinfo=tz)
+        habit.next_due_at = due_at
+    Habit.objects.bulk_update(habits, ["next_due_at"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("habits", "0001_initial"),
+        ("user", "0004_user_timezone"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReminderDelivery",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("scheduled_date", models.DateField(verbose_name="Дата напоминания")),
+                ("scheduled_minute", models.PositiveSmallIntegerField(verbose_name="Минута суток напоминания")),
+                (
+                    "claim_token",
+                    models.UUIDField(
+                        db_index=True,
+                        help_text="Идентификатор запуска планировщика, который забрал напоминание на отправку",
+                        verbose_name="Токен захвата",
+                    ),
+                ),
+                ("is_sent", models.BooleanField(default=False, verbose_name="Отправлено")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата создания")),
+                (
+                    "habit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="habits.habit",
+                        verbose_name="Привычка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Доставка напоминания",
+                "verbose_name_plural": "Доставки напоминаний",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("habit", "scheduled_date", "scheduled_minute"), name="unique_habit_reminder_delivery"
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="habit",
+            name="next_due_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="Момент следующего напоминания с учетом часового пояса пользователя и периодичности",
+                null=True,
+                verbose_name="Следующее напоминание",
+            ),
+        ),
+        migrations.RunPython(fill_next_due_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2025-10-18 16:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0002_habit_next_due_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(fields=["-created_at", "-id"], name="habit_created_at_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="habit",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="habit_user_created_at_id_idx"),
+        ),
+    ]
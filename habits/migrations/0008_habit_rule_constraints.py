@@ -0,0 +1,70 @@
+# Generated by Django 5.2.6 on 2025-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+from django.db.models.functions import Now
+
+
+def fix_rule_violations(apps, schema_editor):
+    """
+    Приводим существующие привычки к правилам validate_habit_rules, иначе CHECK-ограничения не добавятся.
+    Значения сдвигаются к ближайшим допустимым, updated_at меняется, чтобы сбросить ETag исправленных привычек.
+    """
+    Habit = apps.get_model("habits", "Habit")
+    has_reward = Q(reward__isnull=False) & ~Q(reward="")
+
+    # У приятной привычки не может быть ни вознаграждения, ни связанной привычки
+    Habit.objects.filter(Q(is_pleasant=True) & (has_reward | Q(related_habit__isnull=False))).update(
+        reward=None, related_habit=None, updated_at=Now()
+    )
+    # Вознаграждение и связанная привычка одновременно: оставляем вознаграждение - его и показывало напоминание
+    Habit.objects.filter(has_reward, related_habit__isnull=False).update(related_habit=None, updated_at=Now())
+    Habit.objects.filter(is_pleasant=False, duration__gt=120).update(duration=120, updated_at=Now())
+    Habit.objects.filter(frequency__gt=7).update(frequency=7, updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("habits", "0007_habit_access_pattern_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_rule_violations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("related_habit__isnull", True), ("reward__isnull", True), ("reward", ""), _connector="OR"
+                ),
+                name="habit_reward_or_related_habit",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("is_pleasant", False),
+                    models.Q(
+                        ("related_habit__isnull", True),
+                        models.Q(("reward__isnull", True), ("reward", ""), _connector="OR"),
+                    ),
+                    _connector="OR",
+                ),
+                name="habit_pleasant_without_reward",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("is_pleasant", True), ("duration__lte", 120), _connector="OR"),
+                name="habit_useful_max_duration",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="habit",
+            constraint=models.CheckConstraint(condition=models.Q(("frequency__lte", 7)), name="habit_max_frequency"),
+        ),
+    ]
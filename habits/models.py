@@ -1,8 +1,29 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .validators import (
+    HABIT_MAX_FREQUENCY,
+    USEFUL_HABIT_MAX_DURATION,
+    validate_habit_duration,
+    validate_habit_frequency,
+    validate_habit_rules
+)
 
-from .validators import validate_habit_duration, validate_habit_frequency
+
+def reschedule_habits(habits):
+    """Пересчитывает время следующего напоминания (например, после смены часового пояса владельца)"""
+    habits = list(habits.select_related("user"))
+    for habit in habits:
+        habit.next_due_at = None
+        habit.next_due_at = habit.get_next_due_at()
+    Habit.objects.bulk_update(habits, ["next_due_at"], batch_size=1000)
 
 
 class Habit(models.Model):
@@ -61,6 +82,16 @@ class Habit(models.Model):
         default=False, verbose_name="Признак публичности", help_text="Могут ли другие пользователи видеть эту привычку"
     )
 
+    # Планировщик напоминаний
+    next_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Следующее напоминание",
+        help_text="Момент следующего напоминания с учетом часового пояса пользователя и периодичности",
+    )
+
     # Даты для отслеживания
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
@@ -69,42 +100,182 @@ class Habit(models.Model):
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
         ordering = ["-created_at"]
+        indexes = [
+            # Список своих привычек в API (курсорная пагинация по created_at, id)
+            models.Index(fields=["user", "-created_at", "-id"], name="habit_user_created_at_id_idx"),
+            # HTML-список своих привычек с фильтром полезные/приятные
+            models.Index(fields=["user", "is_pleasant", "-created_at"], name="habit_user_pleasant_idx"),
+            # Полезные привычки пользователя по id (/my_habits в боте)
+            models.Index(fields=["user", "id"], name="habit_user_useful_id_idx", condition=Q(is_pleasant=False)),
+            # Публичная лента: частичный индекс только по публичным привычкам
+            models.Index(
+                fields=["-created_at", "-id"], name="habit_public_created_at_idx", condition=Q(is_public=True)
+            ),
+        ]
+        # Правила validate_habit_rules на уровне БД: страхуют быстрый путь save(validated=True) и bulk-операции
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(related_habit__isnull=True) | Q(reward__isnull=True) | Q(reward=""),
+                name="habit_reward_or_related_habit",
+            ),
+            models.CheckConstraint(
+                condition=Q(is_pleasant=False)
+                | Q(related_habit__isnull=True) & (Q(reward__isnull=True) | Q(reward="")),
+                name="habit_pleasant_without_reward",
+            ),
+            models.CheckConstraint(
+                condition=Q(is_pleasant=True) | Q(duration__lte=USEFUL_HABIT_MAX_DURATION),
+                name="habit_useful_max_duration",
+            ),
+            models.CheckConstraint(condition=Q(frequency__lte=HABIT_MAX_FREQUENCY), name="habit_max_frequency"),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.action} в {self.time}"
 
-    def clean(self):
-        """Кастомная валидация модели"""
-        errors = {}
-
-        # 1. Исключить одновременный выбор связанной привычки и указания вознаграждения
-        if self.related_habit and self.reward:
-            errors["reward"] = "Нельзя указывать одновременно и связанную привычку, и вознаграждение"
-            errors["related_habit"] = "Нельзя указывать одновременно и связанную привычку, и вознаграждение"
-
-        # 2. В связанные привычки могут попадать только привычки с признаком приятной привычки
-        if self.related_habit and not self.related_habit.is_pleasant:
-            errors["related_habit"] = "В связанные привычки могут попадать только приятные привычки"
-
-        # 3. У приятной привычки не может быть вознаграждения или связанной привычки
-        if self.is_pleasant:
-            if self.reward:
-                errors["reward"] = "У приятной привычки не может быть вознаграждения"
-            if self.related_habit:
-                errors["related_habit"] = "У приятной привычки не может быть связанной привычки"
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное расписание, чтобы пересчитать next_due_at только при его изменении
+        instance._loaded_schedule = (instance.__dict__.get("time"), instance.__dict__.get("frequency"))
+        # и публичность - чтобы сбрасывать публичную ленту, только если привычка в ней есть или была
+        instance._loaded_is_public = instance.__dict__.get("is_public")
+        return instance
+
+    def get_next_due_at(self, after=None):
+        """
+        Ближайший момент напоминания позже after (по умолчанию - текущего момента).
+        Для нового расписания отсчет идет от сегодняшнего дня с шагом в сутки,
+        иначе - через frequency дней от текущего next_due_at с тем же шагом.
+        Время считается в часовом поясе пользователя, поэтому переход на летнее время учитывается;
+        результат приводится к UTC, чтобы время из пропущенного при переводе часа стало однозначным.
+        """
+        tz = ZoneInfo(self.user.timezone)
+        after = after or timezone.now()
+
+        if self.next_due_at is None:
+            due_date = after.astimezone(tz).date()
+            step = 1
         else:
-            # 4. Время выполнения полезной привычки не больше 120 секунд
-            if self.duration > 120:
-                errors["duration"] = "Время выполнения полезной привычки должно быть не больше 120 секунд"
+            step = self.frequency
+            due_date = self.next_due_at.astimezone(tz).date() + timedelta(days=step)
+
+        due_at = datetime.combine(due_date, self.time, tzinfo=tz)
+        while due_at <= after:
+            due_date += timedelta(days=step)
+            due_at = datetime.combine(due_date, self.time, tzinfo=tz)
+        return due_at.astimezone(dt_timezone.utc)
+
+    def check_rules(self, related_is_pleasant=None):
+        """
+        Правила привычки по значениям в памяти, без запросов к БД.
+        Признак приятности связанной привычки проверяется, если она уже загружена (или он передан явно).
+        """
+        if related_is_pleasant is None and self.related_habit_id is not None and Habit.related_habit.is_cached(self):
+            related_is_pleasant = self.related_habit.is_pleasant
 
-        # 5. Нельзя выполнять привычку реже, чем 1 раз в 7 дней
-        if self.frequency > 7:
-            errors["frequency"] = "Нельзя выполнять привычку реже, чем 1 раз в 7 дней"
+        return validate_habit_rules(
+            is_pleasant=self.is_pleasant,
+            reward=self.reward,
+            related_habit_id=self.related_habit_id,
+            duration=self.duration,
+            frequency=self.frequency,
+            related_is_pleasant=related_is_pleasant,
+        )
 
+    def clean(self):
+        """Кастомная валидация модели (полная: признак связанной привычки при необходимости читается из БД)"""
+        related_is_pleasant = None
+        if self.related_habit_id is not None and not Habit.related_habit.is_cached(self):
+            related_is_pleasant = (
+                Habit.objects.filter(pk=self.related_habit_id).values_list("is_pleasant", flat=True).first()
+            )
+
+        errors = self.check_rules(related_is_pleasant)
         if errors:
             raise ValidationError(errors)
 
-    def save(self, *args, **kwargs):
-        """Переопределяем save для вызова полной валидации"""
-        self.full_clean()
+    def refresh_next_due_at(self):
+        """
+        При изменении времени или периодичности расписание напоминаний начинается заново.
+        Возвращает True, если next_due_at был пересчитан.
+        """
+        if self.next_due_at is not None and (self.time, self.frequency) == getattr(self, "_loaded_schedule", None):
+            return False
+
+        self.next_due_at = None
+        self.next_due_at = self.get_next_due_at()
+        return True
+
+    def save(self, *args, validated=False, **kwargs):
+        """
+        Переопределяем save для вызова полной валидации.
+        validated=True - данные уже проверены (сериализатором, формой или пакетным API): остается только
+        проверка правил по значениям в памяти без SELECT, а CHECK-ограничения БД страхуют от остального.
+        """
+        if validated:
+            errors = self.check_rules()
+            if errors:
+                raise ValidationError(errors)
+        else:
+            # Ограничения БД повторяют check_rules, их проверка через full_clean стоила бы лишних SELECT
+            self.full_clean(validate_constraints=False)
+
+        if self.refresh_next_due_at():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "next_due_at"}
+
         super().save(*args, **kwargs)
+        self._loaded_schedule = (self.time, self.frequency)
+
+        self.invalidate_caches()
+        self._loaded_is_public = self.is_public
+
+    def delete(self, *args, **kwargs):
+        # Сброс после удаления: иначе вне транзакции читатель успел бы закэшировать привычку под новой версией
+        result = super().delete(*args, **kwargs)
+        self.invalidate_caches()
+        return result
+
+    @property
+    def in_public_feed(self):
+        """Есть ли привычка в публичной ленте сейчас или была при загрузке из БД"""
+        return self.is_public or bool(getattr(self, "_loaded_is_public", False))
+
+    def invalidate_caches(self):
+        """Сброс кэшей, в которые попадает привычка: публичная лента (если привычка в ней) и списки владельца"""
+        from .list_cache import bump_habit_list_version
+        from .public_feed import invalidate_public_feed
+
+        if self.in_public_feed:
+            invalidate_public_feed()
+        bump_habit_list_version(self.user_id)
+
+
+class ReminderDelivery(models.Model):
+    """Журнал доставки напоминаний: одна запись на каждое запланированное напоминание"""
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="deliveries", verbose_name="Привычка")
+    scheduled_date = models.DateField(verbose_name="Дата напоминания")
+    scheduled_minute = models.PositiveSmallIntegerField(verbose_name="Минута суток напоминания")
+    claim_token = models.UUIDField(
+        db_index=True,
+        verbose_name="Токен захвата",
+        help_text="Идентификатор запуска планировщика, который забрал напоминание на отправку",
+    )
+    is_sent = models.BooleanField(default=False, verbose_name="Отправлено")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Доставка напоминания"
+        verbose_name_plural = "Доставки напоминаний"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["habit", "scheduled_date", "scheduled_minute"], name="unique_habit_reminder_delivery"
+            )
+        ]
+
+    def __str__(self):
+        hours, minutes = divmod(self.scheduled_minute, 60)
+        return f"{self.habit_id}: {self.scheduled_date} {hours:02d}:{minutes:02d}"
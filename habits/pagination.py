@@ -0,0 +1,74 @@
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+from .public_feed import get_public_feed_page
+
+
+class HabitCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация списков привычек по (created_at, id).
+    В отличие от PageNumberPagination не делает COUNT(*) и OFFSET: страница читается по индексу от курсора.
+    """
+
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    page_size_query_param = "page_size"
+    max_page_size = settings.HABIT_API_MAX_PAGE_SIZE
+    ordering = ("-created_at", "-id")
+
+
+class PublicFeedPagination(HabitCursorPagination):
+    """
+    Та же курсорная пагинация, но по закэшированной публичной ленте.
+    Лента упорядочена по (-created_at, -id), позиция курсора - "created_at_us:id".
+    """
+
+    # Ссылки (следующая, предыдущая) страницы ленты; None - страница собрана обычным запросом к БД
+    feed_links = None
+
+    def paginate_feed(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        key = None if cursor is None else self.decode_position(cursor.position)
+        reverse = cursor is not None and cursor.reverse
+
+        entries = get_public_feed_page(request.user, key, reverse, page_size)
+        has_more = len(entries) > page_size
+        page = entries[:page_size]
+
+        if reverse:
+            # Записи пришли от курсора к началу ленты; назад пришли со следующей страницы, значит она есть
+            page.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.feed_links = (
+            self.encode_page_cursor(page[-1], reverse=False) if page and has_next else None,
+            self.encode_page_cursor(page[0], reverse=True) if page and has_previous else None,
+        )
+        return page
+
+    def decode_position(self, position):
+        try:
+            created_at, habit_id = (int(value) for value in position.split(":"))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return -created_at, -habit_id
+
+    def encode_page_cursor(self, entry, reverse):
+        created_at, habit_id = entry["position"]
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=f"{created_at}:{habit_id}"))
+
+    def get_next_link(self):
+        if self.feed_links is None:
+            return super().get_next_link()
+        return self.feed_links[0]
+
+    def get_previous_link(self):
+        if self.feed_links is None:
+            return super().get_previous_link()
+        return self.feed_links[1]
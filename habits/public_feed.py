@@ -0,0 +1,177 @@
+import bisect
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .metrics import record_cache_lookup
+from .models import Habit
+from .serializers import PublicHabitRowSerializer
+
+PUBLIC_FEED_VERSION_KEY = "public_habit_feed_version"
+# part - "index" (границы кусков) или номер куска ленты
+PUBLIC_FEED_CACHE_KEY = "public_habit_feed:{version}:{part}"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def feed_position(row):
+    """Позиция привычки в ленте: (created_at в микросекундах, id), лента упорядочена по убыванию"""
+    return (row["created_at"] - EPOCH) // timedelta(microseconds=1), row["id"]
+
+
+def feed_key(position):
+    """Ключ по возрастанию для bisect: лента идет по убыванию позиции"""
+    created_at, habit_id = position
+    return -created_at, -habit_id
+
+
+def entry_key(entry):
+    return feed_key(entry["position"])
+
+
+def get_feed_entries(queryset):
+    """
+    Записи ленты из строк values(): готовые данные PublicHabitRowSerializer для API, id, автор и позиция.
+    Экземпляры моделей в кэш не попадают - только то, что отдается в ответе.
+    """
+    rows = list(PublicHabitRowSerializer.get_rows(queryset, extra_fields=("user_id",)))
+    payloads = PublicHabitRowSerializer(rows, many=True).data
+    return [
+        {"id": row["id"], "user_id": row["user_id"], "position": feed_position(row), "payload": payload}
+        for row, payload in zip(rows, payloads)
+    ]
+
+
+def get_public_feed_version():
+    """Версия ленты; ключ хранится без срока жизни, а если его вытеснили - берется от текущего времени"""
+    version = cache.get(PUBLIC_FEED_VERSION_KEY)
+    if version is None:
+        cache.add(PUBLIC_FEED_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(PUBLIC_FEED_VERSION_KEY)
+    return version
+
+
+def build_public_feed(version):
+    """
+    Первые PUBLIC_FEED_CACHE_SIZE привычек ленты одним запросом, разложенные в кэш кусками
+    по PUBLIC_FEED_CHUNK_SIZE. Индекс хранит ключи начала кусков, ключ последней записи
+    и признак того, что в кэш попала вся лента.
+    """
+    size = settings.PUBLIC_FEED_CACHE_SIZE
+    chunk_size = settings.PUBLIC_FEED_CHUNK_SIZE
+
+    entries = get_feed_entries(Habit.objects.filter(is_public=True).order_by("-created_at", "-id")[: size + 1])
+    complete = len(entries) <= size
+    entries = entries[:size]
+
+    chunks = [entries[i : i + chunk_size] for i in range(0, len(entries), chunk_size)]
+    index = {
+        "starts": [entry_key(chunk[0]) for chunk in chunks],
+        "end": entry_key(entries[-1]) if entries else None,
+        "complete": complete,
+    }
+
+    values = {PUBLIC_FEED_CACHE_KEY.format(version=version, part="index"): index}
+    for number, chunk in enumerate(chunks):
+        values[PUBLIC_FEED_CACHE_KEY.format(version=version, part=number)] = chunk
+    cache.set_many(values, settings.PUBLIC_FEED_CACHE_TTL)
+
+    return index, chunks
+
+
+class PublicFeedReader:
+    """Чтение закэшированной ленты в пределах одного запроса: индекс и только нужные куски"""
+
+    def __init__(self):
+        self.version = get_public_feed_version()
+        self.index = cache.get(PUBLIC_FEED_CACHE_KEY.format(version=self.version, part="index"))
+        record_cache_lookup("public_feed", hit=self.index is not None)
+
+        self.chunks = {}
+        if self.index is None:
+            self.rebuild()
+
+    def rebuild(self):
+        self.index, chunks = build_public_feed(self.version)
+        self.chunks = dict(enumerate(chunks))
+
+    def covers(self, key):
+        """Лежат ли в кэше все записи ленты до ключа key включительно"""
+        return self.index["complete"] or (self.index["end"] is not None and key <= self.index["end"])
+
+    def get_chunk(self, number):
+        if number not in self.chunks:
+            chunk = cache.get(PUBLIC_FEED_CACHE_KEY.format(version=self.version, part=number))
+            if chunk is None:
+                # Кусок вытеснен из кэша - пересобираем ленту целиком одним запросом
+                self.rebuild()
+                return self.chunks.get(number, [])
+            self.chunks[number] = chunk
+        return self.chunks[number]
+
+    def iter_after(self, key):
+        """Записи ленты после ключа (с начала ленты при key=None) в порядке ленты"""
+        starts = self.index["starts"]
+        first = 0 if key is None else max(0, bisect.bisect_right(starts, key) - 1)
+        for number in range(first, len(starts)):
+            chunk = self.get_chunk(number)
+            start = 0 if key is None else bisect.bisect_right(chunk, key, key=entry_key)
+            yield from chunk[start:]
+
+    def iter_before(self, key):
+        """Записи ленты перед ключом в обратном порядке (от ближайшей к началу ленты)"""
+        for number in range(bisect.bisect_left(self.index["starts"], key) - 1, -1, -1):
+            chunk = self.get_chunk(number)
+            yield from reversed(chunk[: bisect.bisect_left(chunk, key, key=entry_key)])
+
+
+def query_feed(user, key, reverse, limit):
+    """Записи ленты из БД по (created_at, id) от ключа курсора - для страниц глубже закэшированной части"""
+    queryset = Habit.objects.filter(is_public=True).exclude(user=user)
+    if key is not None:
+        created_at, habit_id = EPOCH + timedelta(microseconds=-key[0]), -key[1]
+        if reverse:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=habit_id))
+        else:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=habit_id))
+    ordering = ("created_at", "id") if reverse else ("-created_at", "-id")
+    return get_feed_entries(queryset.order_by(*ordering)[:limit])
+
+
+def get_public_feed_page(user, key, reverse, size):
+    """
+    До size + 1 записей ленты для пользователя (без его собственных привычек) от ключа курсора
+    в направлении чтения; лишняя запись показывает, что дальше есть еще.
+    Первые PUBLIC_FEED_CACHE_SIZE привычек читаются из кэша, более глубокие страницы - из БД.
+    """
+    feed = PublicFeedReader()
+    limit = size + 1
+
+    if key is not None and not feed.covers(key):
+        return query_feed(user, key, reverse, limit)
+
+    entries = feed.iter_before(key) if reverse else feed.iter_after(key)
+    page = list(islice((entry for entry in entries if entry["user_id"] != user.id), limit))
+
+    if not reverse and len(page) < limit and not feed.index["complete"]:
+        # Закэшированная часть ленты кончилась - продолжаем из БД
+        page += query_feed(user, feed.index["end"], False, limit - len(page))
+    return page
+
+
+def invalidate_public_feed():
+    """Сброс ленты сменой версии после фиксации транзакции, чтобы ее не пересобрали из несохраненных данных"""
+
+    def bump():
+        try:
+            cache.incr(PUBLIC_FEED_VERSION_KEY)
+        except ValueError:
+            cache.add(PUBLIC_FEED_VERSION_KEY, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
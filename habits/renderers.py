@@ -0,0 +1,48 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson есть в зависимостях проекта; без него работают стандартные JSONRenderer и JSONParser
+    orjson = None
+
+# Z вместо +00:00 у datetime в UTC - как у JSONEncoder DRF; нестроковые ключи словарей - как у json.dumps
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+# Типы, которых orjson не знает, кодируются так же, как в стандартном JSONRenderer
+encode_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson: datetime, date, time и UUID кодируются нативно, остальное (Decimal, timedelta,
+    ленивые строки, QuerySet) - тем же JSONEncoder DRF. Ответ с отступами (?indent, Browsable API) и
+    окружение без orjson обрабатывает стандартный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b""
+
+        ret = orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+        # U+2028 и U+2029 допустимы в JSON, но не в JavaScript - экранируем, как и JSONRenderer DRF
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson; без orjson - стандартный разбор через json"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from html import escape
+
+from django.conf import settings
+
+REMINDER_TEMPLATE = (
+    "⏰ <b>Время выполнить привычку!</b>\n\n"
+    "<b>{action}</b>\n"
+    "🕐 Время: {time}\n"
+    "📍 Место: {place}\n"
+    "⏱ Длительность: {duration} секунд\n"
+)
+REMINDER_REWARD_TEMPLATE = "🎁 Вознаграждение: {reward}\n"
+REMINDER_RELATED_TEMPLATE = "🔗 Связанная привычка: {related_action}\n"
+REMINDER_FOOTER = "\n💪 Удачи в выполнении!"
+
+HABIT_LIST_ITEM_TEMPLATE = "🎯 *{action}*\n   ⏰ {time}\n   📍 {place}\n   🔄 раз в {frequency} дней\n\n"
+
+
+class RenderCache:
+    """Потокобезопасный ограниченный LRU-кэш готовых текстов сообщений"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        text = render()
+
+        with self._lock:
+            self._items[key] = text
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+        return text
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+render_cache = RenderCache(settings.HABIT_RENDER_CACHE_SIZE)
+
+
+def _cache_key(kind, habit):
+    """Ключ кэша: привычка и время ее изменения (и связанной привычки, если она есть)"""
+    related_updated_at = habit.related_habit.updated_at if habit.related_habit_id else None
+    return kind, habit.id, habit.updated_at, related_updated_at
+
+
+def render_habit_reminder(habit):
+    """Текст напоминания о привычке для Telegram (HTML)"""
+
+    def render():
+        message = REMINDER_TEMPLATE.format(
+            action=escape(habit.action),
+            time=habit.time.strftime("%H:%M"),
+            place=escape(habit.place),
+            duration=habit.duration,
+        )
+
+        if habit.reward:
+            message += REMINDER_REWARD_TEMPLATE.format(reward=escape(habit.reward))
+        elif habit.related_habit_id:
+            message += REMINDER_RELATED_TEMPLATE.format(related_action=escape(habit.related_habit.action))
+
+        return message + REMINDER_FOOTER
+
+    return render_cache.get_or_render(_cache_key("reminder", habit), render)
+
+
+def render_habit_list_item(habit):
+    """Строка списка привычек для бота (Markdown)"""
+
+    def render():
+        return HABIT_LIST_ITEM_TEMPLATE.format(
+            action=habit.action,
+            time=habit.time.strftime("%H:%M"),
+            place=habit.place,
+            frequency=habit.frequency,
+        )
+
+    return render_cache.get_or_render(("list_item", habit.id, habit.updated_at), render)
@@ -1,3 +1,8 @@
+from copy import copy
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
 from rest_framework import serializers
 
 from .models import Habit
@@ -26,30 +31,30 @@ class HabitSerializer(serializers.ModelSerializer):
         read_only_fields = ["user", "created_at", "updated_at"]
 
     def validate(self, data):
-        """Дополнительная валидация на уровне сериализатора"""
-        # Проверяем те же условия, что и в модели
-        related_habit = data.get("related_habit")
-        reward = data.get("reward")
-        is_pleasant = data.get("is_pleasant", self.instance.is_pleasant if self.instance else False)
-
-        if related_habit and reward:
-            raise serializers.ValidationError("Нельзя указывать одновременно и связанную привычку, и вознаграждение")
+        """Дополнительная валидация на уровне сериализатора (те же правила, что и в модели)"""
+        # Проверяем привычку в том виде, в котором она будет сохранена: текущие значения + изменения
+        habit = copy(self.instance) if self.instance else Habit()
+        for attr, value in data.items():
+            setattr(habit, attr, value)
 
-        if related_habit and not related_habit.is_pleasant:
-            raise serializers.ValidationError("В связанные привычки могут попадать только приятные привычки")
-
-        if is_pleasant:
-            if reward:
-                raise serializers.ValidationError("У приятной привычки не может быть вознаграждения")
-            if related_habit:
-                raise serializers.ValidationError("У приятной привычки не может быть связанной привычки")
+        errors = habit.check_rules()
+        if errors:
+            raise serializers.ValidationError(errors)
 
         return data
 
     def create(self, validated_data):
-        """Автоматически назначаем текущего пользователя"""
+        """Автоматически назначаем текущего пользователя; данные уже проверены - сохраняем без full_clean"""
         validated_data["user"] = self.context["request"].user
-        return super().create(validated_data)
+        habit = Habit(**validated_data)
+        habit.save(validated=True)
+        return habit
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(validated=True)
+        return instance
 
 
 class PublicHabitSerializer(serializers.ModelSerializer):
@@ -61,3 +66,134 @@ class PublicHabitSerializer(serializers.ModelSerializer):
         model = Habit
         fields = ["id", "user", "place", "time", "action", "frequency", "duration", "created_at"]
         read_only_fields = fields
+
+
+def format_datetime(value, tz):
+    """Дата-время в том же виде, что и DateTimeField DRF: ISO 8601 в текущем часовом поясе, UTC - как Z"""
+    if value is None:
+        return None
+    if tz is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+class HabitRowSerializer(serializers.BaseSerializer):
+    """
+    Быстрый сериализатор списков для чтения: принимает строки values() вместо экземпляров модели
+    и собирает словарь вручную, без полей DRF. Формат ответа совпадает с HabitSerializer.
+    """
+
+    row_fields = (
+        "id",
+        "user_id",
+        "place",
+        "time",
+        "action",
+        "is_pleasant",
+        "related_habit_id",
+        "reward",
+        "frequency",
+        "duration",
+        "is_public",
+        "created_at",
+        "updated_at",
+    )
+
+    @classmethod
+    def get_rows(cls, queryset):
+        return queryset.values(*cls.row_fields)
+
+    def to_representation(self, row):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return {
+            "id": row["id"],
+            "user": row["user_id"],
+            "place": row["place"],
+            "time": row["time"].isoformat(),
+            "action": row["action"],
+            "is_pleasant": row["is_pleasant"],
+            "related_habit": row["related_habit_id"],
+            "reward": row["reward"],
+            "frequency": row["frequency"],
+            "duration": row["duration"],
+            "is_public": row["is_public"],
+            "created_at": format_datetime(row["created_at"], tz),
+            "updated_at": format_datetime(row["updated_at"], tz),
+        }
+
+
+class PublicHabitRowSerializer(serializers.BaseSerializer):
+    """
+    Быстрый сериализатор публичных привычек по строкам values(): имя автора приходит аннотацией
+    в том же запросе, а не через User.__str__ с ленивой загрузкой пользователя на каждую привычку.
+    Формат ответа совпадает с PublicHabitSerializer.
+    """
+
+    row_fields = ("id", "username", "place", "time", "action", "frequency", "duration", "created_at")
+
+    @classmethod
+    def get_rows(cls, queryset, extra_fields=()):
+        return queryset.annotate(username=F("user__username")).values(*cls.row_fields, *extra_fields)
+
+    def to_representation(self, row):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return {
+            "id": row["id"],
+            "user": row["username"],
+            "place": row["place"],
+            "time": row["time"].isoformat(),
+            "action": row["action"],
+            "frequency": row["frequency"],
+            "duration": row["duration"],
+            "created_at": format_datetime(row["created_at"], tz),
+        }
+
+
+class PrefetchedHabitField(serializers.PrimaryKeyRelatedField):
+    """Связанная привычка из заранее загруженного словаря context["related_habits"] без запроса на каждый элемент"""
+
+    def to_internal_value(self, data):
+        related_habits = self.context.get("related_habits")
+        if related_habits is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return related_habits[int(data)]
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+
+
+class HabitBulkItemSerializer(HabitSerializer):
+    """Привычка в пакетном запросе: связанные привычки загружаются одним запросом на весь пакет"""
+
+    related_habit = PrefetchedHabitField(queryset=Habit.objects.all(), required=False, allow_null=True)
+
+
+class HabitBulkSerializer(serializers.Serializer):
+    """Пакетный запрос: {"create": [...], "update": [{"id": ..., ...}], "delete": [id, ...]}"""
+
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate_update(self, items):
+        for item in items:
+            if not isinstance(item.get("id"), int) or isinstance(item["id"], bool):
+                raise serializers.ValidationError("У каждой изменяемой привычки должен быть целочисленный id")
+        return items
+
+    def validate(self, data):
+        total = len(data["create"]) + len(data["update"]) + len(data["delete"])
+        if total > settings.HABIT_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(f"Не больше {settings.HABIT_BULK_MAX_ITEMS} элементов за один запрос")
+
+        ids = [item["id"] for item in data["update"]] + data["delete"]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Каждая привычка может встречаться в пакете только один раз")
+
+        return data
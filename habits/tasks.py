@@ -1,56 +1,166 @@
 import logging
+import math
+import time
+import uuid
+from datetime import timedelta
 
 import requests
 from celery import shared_task
+from celery.exceptions import MaxRetriesExceededError
+from celery.signals import task_postrun
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from .metrics import metrics, record_message_outcome, record_telegram_response
+from .rendering import render_habit_reminder
+from .telegram_client import (
+    get_api_url,
+    get_retry_after,
+    get_telegram_session,
+    get_throttle_delay,
+    get_timeout,
+    pause_sending,
+    send_messages_bulk_sync
+)
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-# Настраиваем логирование
-logging.basicConfig(level=logging.INFO)
-logger.setLevel(logging.INFO)
+# Насколько (в минутах) напоминание может опоздать; более старые пропускаются без отправки
+REMINDER_MAX_DELAY_MINUTES = 5
+# Сколько раз переотправлять напоминание, если Telegram ответил 429 (слишком много запросов) или сеть недоступна
+REMINDER_MAX_RETRIES = 3
+# Задержка (в секундах) первого повтора после сетевой ошибки; дальше удваивается
+REMINDER_NETWORK_RETRY_DELAY = 5
+# Сколько дней хранить записи журнала доставки напоминаний
+REMINDER_DELIVERY_RETENTION_DAYS = 7
+# Размер пачки для массовых INSERT/UPDATE планировщика
+SCHEDULER_DB_BATCH_SIZE = 1000
+
+# Поля привычки, которые нужны для отправки напоминания
+REMINDER_FIELDS = (
+    "id",
+    "action",
+    "time",
+    "place",
+    "duration",
+    "reward",
+    "related_habit",
+    "updated_at",
+    "user__telegram_chat_id",
+    "user__telegram_notifications",
+    "related_habit__action",
+    "related_habit__updated_at",
+)
+
+
+def claim_reminders(habits):
+    """
+    Атомарно забирает напоминания на отправку через журнал ReminderDelivery.
+    Уникальный индекс (привычка, дата, минута напоминания по UTC) гарантирует, что каждое
+    напоминание достанется ровно одному запуску планировщика, даже если запуски пересекаются.
+    Возвращает токен захвата и множество id захваченных привычек.
+    """
+    from .models import ReminderDelivery
+
+    claim_token = uuid.uuid4()
+    deliveries = []
+    for habit in habits:
+        # next_due_at хранится в UTC
+        scheduled = habit.next_due_at
+        deliveries.append(
+            ReminderDelivery(
+                habit_id=habit.id,
+                scheduled_date=scheduled.date(),
+                scheduled_minute=scheduled.hour * 60 + scheduled.minute,
+                claim_token=claim_token,
+            )
+        )
 
+    # Чужие (уже захваченные) напоминания отбрасываются уникальным индексом
+    ReminderDelivery.objects.bulk_create(deliveries, ignore_conflicts=True, batch_size=SCHEDULER_DB_BATCH_SIZE)
+    claimed_ids = set(ReminderDelivery.objects.filter(claim_token=claim_token).values_list("habit_id", flat=True))
+    return claim_token, claimed_ids
 
-def send_habit_reminder(chat_id, message):
-    """Синхронная отправка сообщения в Telegram с подробным логированием"""
-    logger.info("=== НАЧАЛО ОТПРАВКИ TELEGRAM СООБЩЕНИЯ ===")
-    logger.info(f"Chat ID: {chat_id}")
-    logger.info(f"Message: {message}")
+
+def send_telegram_message(chat_id, message):
+    """
+    Синхронная отправка сообщения в Telegram (метрики - в habits.metrics, подробности - в DEBUG-логе).
+    Результат в том же виде, что и у send_messages_bulk: {"chat_id", "ok", "status", "error", "retry_after"};
+    retry_after задан, если Telegram ответил 429 или отправка не делалась из-за общей паузы.
+    """
+    result = {"chat_id": chat_id, "ok": False, "status": None, "error": None, "retry_after": None}
 
     if not settings.TELEGRAM_BOT_TOKEN:
         logger.error("❌ TELEGRAM_BOT_TOKEN не настроен!")
-        return False
+        result["error"] = "TELEGRAM_BOT_TOKEN не настроен"
+        return result
 
-    logger.info("✅ TELEGRAM_BOT_TOKEN найден")
+    # Telegram попросил подождать - не нагружаем API, пока действует общая пауза
+    throttle_delay = get_throttle_delay()
+    if throttle_delay:
+        logger.debug(f"⏳ Отправка в чат {chat_id} приостановлена еще на {throttle_delay:.0f} сек")
+        record_message_outcome("throttled")
+        result["retry_after"] = math.ceil(throttle_delay)
+        return result
 
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
+    logger.debug(f"🔄 Отправка сообщения в чат {chat_id}")
 
-    logger.info(f"URL: {url}")
-    logger.info(f"Payload: {payload}")
-
+    started = time.perf_counter()
     try:
-        logger.info("🔄 Отправка запроса к Telegram API...")
-        response = requests.post(url, json=payload, timeout=10)
-        logger.info(f"✅ Ответ получен. Status code: {response.status_code}")
-        logger.info(f"📨 Response text: {response.text}")
-
-        if response.status_code == 200:
-            logger.info("🎉 Сообщение успешно отправлено!")
-            return True
-        else:
-            logger.error(f"❌ Ошибка Telegram API: {response.status_code}")
-            logger.error(f"📝 Детали: {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"💥 Ошибка при отправке запроса: {e}")
-        return False
+        response = get_telegram_session().post(get_api_url("sendMessage"), json=payload, timeout=get_timeout())
+    except requests.RequestException as e:
+        record_telegram_response(None, time.perf_counter() - started)
+        record_message_outcome("failed")
+        logger.warning(f"💥 Ошибка при отправке запроса: {e.__class__.__name__}")
+        result["error"] = str(e) or e.__class__.__name__
+        return result
+
+    record_telegram_response(response.status_code, time.perf_counter() - started)
+    result["status"] = response.status_code
+
+    if response.status_code == 200:
+        record_message_outcome("sent")
+        logger.debug(f"🎉 Сообщение в чат {chat_id} отправлено")
+        result["ok"] = True
+        return result
+
+    result["error"] = response.text
+    retry_after = get_retry_after(response)
+    if retry_after:
+        record_message_outcome("throttled")
+        logger.warning(f"⏳ Telegram ограничил частоту отправки, пауза {retry_after} сек")
+        pause_sending(retry_after)
+        result["retry_after"] = retry_after
+        return result
+
+    record_message_outcome("failed")
+    logger.warning(f"❌ Ошибка Telegram API: {response.status_code}")
+    logger.debug(f"📝 Детали: {response.text}")
+    return result
 
 
-@shared_task
-def send_habit_reminder_task(habit_id):
+def send_habit_reminder(chat_id, message):
+    """Отправка сообщения в Telegram; True, если сообщение доставлено"""
+    return send_telegram_message(chat_id, message)["ok"]
+
+
+def get_reminder_retry_delay(result, retries):
+    """
+    Через сколько секунд повторить отправку, или None, если повтор бесполезен.
+    Повторяются только 429 / общая пауза (через retry_after) и сетевые ошибки (с нарастающей задержкой);
+    ответы вроде 403 (бот заблокирован) или 400 повтором не исправить.
+    """
+    if result["retry_after"]:
+        return result["retry_after"]
+    if result["status"] is None and result["error"] is not None and settings.TELEGRAM_BOT_TOKEN:
+        return REMINDER_NETWORK_RETRY_DELAY * 2**retries
+    return None
+
+
+@shared_task(bind=True, max_retries=REMINDER_MAX_RETRIES)
+def send_habit_reminder_task(self, habit_id):
     """Celery задача для отправки напоминания о привычке"""
 
     from .models import Habit
@@ -58,32 +168,33 @@ def send_habit_reminder_task(habit_id):
     # User = get_user_model()
 
     try:
-        habit = Habit.objects.get(id=habit_id)
+        habit = Habit.objects.select_related("user", "related_habit").get(id=habit_id)
         user = habit.user
 
         if not user.telegram_chat_id or not user.telegram_notifications:
             return "❌ У пользователя отключены уведомления или не привязан Telegram"
 
-        message = (
-            f"⏰ <b>Напоминание о привычке!</b>\n\n"
-            f"Пришло время выполнить: <b>{habit.action}</b>\n"
-            f"🕐 Время: {habit.time.strftime('%H:%M')}\n"
-            f"📍 Место: {habit.place}\n"
-            f"⏱ Длительность: {habit.duration} секунд"
-        )
-
-        success = send_habit_reminder(user.telegram_chat_id, message)
+        result = send_telegram_message(user.telegram_chat_id, render_habit_reminder(habit))
 
-        if success:
+        if result["ok"]:
             return f"✅ Напоминание отправлено для: {habit.action}"
-        else:
-            return "❌ Ошибка при отправке напоминания"
 
     except Habit.DoesNotExist:
         return "❌ Привычка не найдена"
     except Exception as e:
         return f"❌ Ошибка: {str(e)}"
 
+    # Повторяем только то, что может пройти позже: 429 / общую паузу и сетевые ошибки этой отправки
+    retry_delay = get_reminder_retry_delay(result, self.request.retries)
+    if retry_delay:
+        try:
+            self.retry(countdown=retry_delay, throw=False)
+            return f"⏳ Отложено на {retry_delay} сек"
+        except MaxRetriesExceededError:
+            logger.error(f"❌ Превышено число повторов для привычки {habit_id}")
+
+    return "❌ Ошибка при отправке напоминания"
+
 
 @shared_task
 def debug_task():
@@ -129,79 +240,137 @@ def send_test_notification():
         return "❌ Ошибка при отправке уведомления"
 
 
+@shared_task(bind=True, max_retries=REMINDER_MAX_RETRIES)
+def send_habit_reminders_batch(self, habit_ids, claim_token):
+    """Celery задача для отправки пакета напоминаний, захваченных планировщиком"""
+    from .models import Habit, ReminderDelivery
+
+    # Один запрос: только поля, нужные для текста напоминания и адресата
+    habits = (
+        Habit.objects.filter(
+            id__in=habit_ids,
+            user__telegram_chat_id__isnull=False,
+            user__telegram_notifications=True,
+        )
+        .select_related("user", "related_habit")
+        .only(*REMINDER_FIELDS)
+    )
+
+    # Тексты берутся из кэша отрисовки: в пиковые минуты повторно не форматируются
+    reminders = [(habit, render_habit_reminder(habit)) for habit in habits]
+
+    if not reminders:
+        return "ℹ️ Напоминаний не найдено"
+
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.error("❌ TELEGRAM_BOT_TOKEN не настроен!")
+        return "❌ TELEGRAM_BOT_TOKEN не настроен"
+
+    # Весь пакет уходит параллельно с учетом лимитов Telegram
+    deliveries = send_messages_bulk_sync([(habit.user.telegram_chat_id, message) for habit, message in reminders])
+
+    results = []
+    sent_ids = []
+    retry_delays = {}
+
+    for (habit, _), delivery in zip(reminders, deliveries):
+        if delivery["ok"]:
+            sent_ids.append(habit.id)
+            results.append(f"✅ Напоминание отправлено: {habit.action}")
+            continue
+
+        # Та же политика повторов, что и у одиночной отправки: 429 / общая пауза и сетевые ошибки
+        retry_delay = get_reminder_retry_delay(delivery, self.request.retries)
+        if retry_delay:
+            retry_delays[habit.id] = retry_delay
+            results.append(f"⏳ Отложено на {retry_delay} сек: {habit.action}")
+        else:
+            logger.debug(f"❌ Ошибка отправки (привычка {habit.id}): {delivery['status']} {delivery['error']}")
+            results.append(f"❌ Ошибка отправки: {habit.action}")
+
+    logger.info(f"📨 Пакет напоминаний: отправлено {len(sent_ids)}, отложено {len(retry_delays)} из {len(reminders)}")
+
+    if sent_ids:
+        ReminderDelivery.objects.filter(claim_token=claim_token, habit_id__in=sent_ids).update(is_sent=True)
+
+    # Отложенные напоминания переотправляем этой же задачей, когда пройдет самая долгая из задержек
+    if retry_delays:
+        try:
+            self.retry(args=(list(retry_delays), claim_token), countdown=max(retry_delays.values()), throw=False)
+        except MaxRetriesExceededError:
+            logger.error(f"❌ Превышено число повторов, напоминания не отправлены: {list(retry_delays)}")
+
+    return "\n".join(results) if results else "ℹ️ Напоминаний не найдено"
+
+
 @shared_task
 def check_and_send_habit_reminders():
-    """Периодическая задача для проверки и отправки напоминаний о привычках"""
-    import logging
-
-    import pytz
+    """
+    Периодическая задача-планировщик напоминаний о привычках.
+    Находит привычки с наступившим next_due_at, забирает их через журнал доставки,
+    сдвигает следующее напоминание на frequency дней и раздает отправку
+    пакетами по HABIT_REMINDER_BATCH_SIZE отдельным задачам.
+    """
+    from celery import group
     from django.utils import timezone
 
     from .models import Habit
 
-    logger = logging.getLogger(__name__)
-    # User = get_user_model()
-
-    logger.info("=== 🔍 ЗАПУСК ПРОВЕРКИ НАПОМИНАНИЙ О ПРИВЫЧКАХ ===")
+    logger.debug("=== 🔍 ЗАПУСК ПРОВЕРКИ НАПОМИНАНИЙ О ПРИВЫЧКАХ ===")
 
-    # Текущее время в Москве
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    now_moscow = timezone.now().astimezone(moscow_tz)
-    current_time_moscow = now_moscow.time()
+    now = timezone.now()
 
-    logger.info(f"Текущее время Москва: {current_time_moscow}")
-
-    # Все привычки пользователей с Telegram
-    habits_to_check = Habit.objects.filter(
-        user__telegram_chat_id__isnull=False,
-        user__telegram_notifications=True,
+    # Один индексный запрос по диапазону: все привычки, время напоминания которых наступило
+    due_habits = list(
+        Habit.objects.filter(
+            next_due_at__lte=now,
+            user__telegram_chat_id__isnull=False,
+            user__telegram_notifications=True,
+        )
+        .select_related("user")
+        .only("id", "time", "frequency", "next_due_at", "user__timezone")
+        .order_by()  # Порядок не нужен: без него БД не сортирует выборку по created_at
     )
 
-    logger.info(f"Привычек для проверки: {habits_to_check.count()}")
+    # Слишком старые напоминания (например, воркер был остановлен) не отправляем
+    oldest_allowed = now - timedelta(minutes=REMINDER_MAX_DELAY_MINUTES)
+    fresh_habits = [habit for habit in due_habits if habit.next_due_at >= oldest_allowed]
 
-    results = []
+    # Забираем напоминания через журнал, чтобы пересекающиеся запуски не дублировали отправку
+    claim_token, claimed_ids = claim_reminders(fresh_habits)
 
-    for habit in habits_to_check:
-        try:
-            # Время привычки в базе - это московское время (просто TimeField)
-            habit_time_moscow = habit.time
+    # Сдвигаем next_due_at на frequency дней для захваченных и пропущенных напоминаний
+    rescheduled = [habit for habit in due_habits if habit.id in claimed_ids or habit.next_due_at < oldest_allowed]
+    for habit in rescheduled:
+        habit.next_due_at = habit.get_next_due_at(after=now)
+    Habit.objects.bulk_update(rescheduled, ["next_due_at"], batch_size=SCHEDULER_DB_BATCH_SIZE)
 
-            # Сравниваем время
-            time_diff = abs(
-                (current_time_moscow.hour * 60 + current_time_moscow.minute)
-                - (habit_time_moscow.hour * 60 + habit_time_moscow.minute)
-            )
+    if not claimed_ids:
+        return "ℹ️ Напоминаний не найдено"
+
+    habit_ids = sorted(claimed_ids)
+    batch_size = settings.HABIT_REMINDER_BATCH_SIZE
+    batches = [habit_ids[i : i + batch_size] for i in range(0, len(habit_ids), batch_size)]
 
-            logger.info(f"Проверка: {habit.action} в {habit_time_moscow}")
-            logger.info(f"Разница с текущим {current_time_moscow}: {time_diff} мин")
+    group(send_habit_reminders_batch.s(batch, str(claim_token)) for batch in batches).apply_async()
 
-            if time_diff <= 2:  # ±2 минуты
-                message = (
-                    f"⏰ <b>Время выполнить привычку!</b>\n\n"
-                    f"<b>{habit.action}</b>\n"
-                    f"🕐 Время: {habit_time_moscow.strftime('%H:%M')}\n"
-                    f"📍 Место: {habit.place}\n"
-                    f"⏱ Длительность: {habit.duration} секунд\n"
-                )
+    logger.info(f"📤 Напоминаний в очереди: {len(habit_ids)}, пакетов: {len(batches)}")
+    return f"📤 Поставлено в очередь напоминаний: {len(habit_ids)} (пакетов: {len(batches)})"
 
-                if habit.reward:
-                    message += f"🎁 Вознаграждение: {habit.reward}\n"
-                elif habit.related_habit:
-                    message += f"🔗 Связанная привычка: {habit.related_habit.action}\n"
 
-                message += "\n💪 Удачи в выполнении!"
+@shared_task
+def cleanup_reminder_deliveries():
+    """Удаление устаревших записей журнала доставки напоминаний"""
+    from django.utils import timezone
 
-                success = send_habit_reminder(habit.user.telegram_chat_id, message)
+    from .models import ReminderDelivery
 
-                if success:
-                    results.append(f"✅ Напоминание отправлено: {habit.action}")
-                    logger.info("✅ УСПЕХ: Напоминание отправлено!")
-                else:
-                    results.append(f"❌ Ошибка отправки: {habit.action}")
+    threshold = timezone.now() - timedelta(days=REMINDER_DELIVERY_RETENTION_DAYS)
+    count, _ = ReminderDelivery.objects.filter(created_at__lt=threshold).delete()
+    return f"🧹 Удалено записей журнала доставки: {count}"
 
-        except Exception as e:
-            error_msg = f"❌ Ошибка: {str(e)}"
-            results.append(error_msg)
-            logger.error(error_msg)
 
-    return "\n".join(results) if results else "ℹ️ Напоминаний не найдено"
+@task_postrun.connect
+def flush_metrics(**kwargs):
+    """Метрики отправки сразу после задачи попадают в общее хранилище, а не ждут METRICS_FLUSH_INTERVAL"""
+    metrics.flush()
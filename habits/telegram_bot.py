@@ -1,14 +1,47 @@
+import asyncio
 import logging
+import os
+import threading
 
-from asgiref.sync import sync_to_async
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+from django.db import close_old_connections
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    SimpleUpdateProcessor,
+    filters
+)
+
+from .chat_cache import chat_user_cache
+from .rendering import render_habit_list_item
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# callback_data кнопок листания /my_habits: "habits:next:<id последней привычки>" / "habits:prev:<id первой>"
+HABITS_PAGE_CALLBACK_PREFIX = "habits"
+
+
+class ThreadSensitiveUpdateProcessor(SimpleUpdateProcessor):
+    """
+    Обработка каждого обновления в своем ThreadSensitiveContext (как Django делает для запросов под ASGI).
+    Без этого все запросы async ORM идут через один общий поток asgiref и выполняются по очереди.
+    """
+
+    async def do_process_update(self, update, coroutine):
+        async with ThreadSensitiveContext():
+            try:
+                await coroutine
+            finally:
+                # Соединение с базой принадлежит потоку контекста - закрываем его вместе с контекстом
+                await sync_to_async(close_old_connections)()
+
 
 class HabitTrackerBot:
     def __init__(self):
@@ -16,7 +49,13 @@ class HabitTrackerBot:
             raise ValueError("TELEGRAM_BOT_TOKEN not set in settings")
 
         self.token = settings.TELEGRAM_BOT_TOKEN
-        self.application = Application.builder().token(self.token).build()
+        self.application = (
+            Application.builder()
+            .token(self.token)
+            .base_url(f"{settings.TELEGRAM_API_URL}/bot")
+            .concurrent_updates(ThreadSensitiveUpdateProcessor(settings.TELEGRAM_BOT_CONCURRENT_UPDATES))
+            .build()
+        )
         self.setup_handlers()
 
     def setup_handlers(self):
@@ -25,35 +64,85 @@ class HabitTrackerBot:
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("my_habits", self.my_habits))
         self.application.add_handler(CommandHandler("notifications", self.toggle_notifications))
+        self.application.add_handler(
+            CallbackQueryHandler(self.my_habits_page, pattern=rf"^{HABITS_PAGE_CALLBACK_PREFIX}:(next|prev):\d+$")
+        )
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
-    @sync_to_async
-    def get_user_by_chat_id(self, chat_id):
-        """Асинхронно получаем пользователя по chat_id"""
-        try:
-            return User.objects.get(telegram_chat_id=chat_id)
-        except User.DoesNotExist:
-            return None
+    async def get_user_by_chat_id(self, chat_id):
+        """
+        Асинхронно получаем пользователя по chat_id (ChatUser из кэша).
+        При попадании в кэш процесса обходимся без обращения к Redis и базе.
+        """
+        found, user = chat_user_cache.get_local(chat_id)
+        if found:
+            return user
+        return await chat_user_cache.aget(chat_id)
 
-    @sync_to_async
-    def get_user_by_email(self, email):
+    async def get_user_by_email(self, email):
         """Асинхронно получаем пользователя по email"""
         try:
-            return User.objects.get(email=email)
+            return await User.objects.aget(email=email)
         except User.DoesNotExist:
             return None
 
-    @sync_to_async
-    def save_user(self, user):
+    async def save_user(self, user):
         """Асинхронно сохраняем пользователя"""
-        user.save()
+        await user.asave()
+
+    async def toggle_user_notifications(self, chat_id):
+        """Асинхронно переключаем уведомления (по актуальным данным из базы, а не из кэша)"""
+        user = await User.objects.filter(telegram_chat_id=chat_id).afirst()
+        if user is None:
+            return None
+
+        user.telegram_notifications = not user.telegram_notifications
+        await user.asave(update_fields=["telegram_notifications"])
+        return user
 
-    @sync_to_async
-    def get_user_habits(self, user):
-        """Асинхронно получаем привычки пользователя"""
+    async def get_user_habits_page(self, user, after_id=None, before_id=None):
+        """
+        Асинхронно получаем страницу привычек пользователя по ключу id (keyset-пагинация).
+        Загружается не больше TELEGRAM_HABITS_PAGE_SIZE + 1 строк: лишняя строка показывает, есть ли продолжение.
+        Возвращает (привычки, есть предыдущая страница, есть следующая страница).
+        """
         from .models import Habit  # Локальный импорт чтобы избежать циклических импортов
 
-        return list(Habit.objects.filter(user=user, is_pleasant=False))
+        page_size = settings.TELEGRAM_HABITS_PAGE_SIZE
+        queryset = Habit.objects.filter(user_id=user.id, is_pleasant=False)
+
+        if before_id is not None:
+            rows = [habit async for habit in queryset.filter(id__lt=before_id).order_by("-id")[: page_size + 1]]
+            return rows[:page_size][::-1], len(rows) > page_size, True
+
+        if after_id is not None:
+            queryset = queryset.filter(id__gt=after_id)
+        rows = [habit async for habit in queryset.order_by("id")[: page_size + 1]]
+        return rows[:page_size], after_id is not None, len(rows) > page_size
+
+    async def build_habits_page(self, user, after_id=None, before_id=None):
+        """Текст и клавиатура страницы /my_habits"""
+        habits, has_prev, has_next = await self.get_user_habits_page(user, after_id, before_id)
+        if not habits and (after_id is not None or before_id is not None):
+            # Привычки с соседней страницы успели удалить - показываем первую страницу
+            habits, has_prev, has_next = await self.get_user_habits_page(user)
+
+        if not habits:
+            return "У вас пока нет привычек. Создайте их на сайте! 🌟", None
+
+        message = "📋 *Ваши привычки:*\n\n" + "".join(render_habit_list_item(habit) for habit in habits)
+
+        buttons = []
+        if has_prev:
+            buttons.append(
+                InlineKeyboardButton("⬅️ Назад", callback_data=f"{HABITS_PAGE_CALLBACK_PREFIX}:prev:{habits[0].id}")
+            )
+        if has_next:
+            buttons.append(
+                InlineKeyboardButton("Вперед ➡️", callback_data=f"{HABITS_PAGE_CALLBACK_PREFIX}:next:{habits[-1].id}")
+            )
+
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -106,32 +195,36 @@ class HabitTrackerBot:
             await update.message.reply_text("❌ Ваш аккаунт не привязан. Введите ваш email для привязки.")
             return
 
-        habits = await self.get_user_habits(user)
+        message, keyboard = await self.build_habits_page(user)
+        await update.message.reply_text(message, parse_mode="Markdown", reply_markup=keyboard)
+
+    async def my_habits_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание списка привычек кнопками под сообщением /my_habits"""
+        query = update.callback_query
+        await query.answer()
 
-        if habits:
-            message = "📋 *Ваши привычки:*\n\n"
-            for habit in habits:
-                message += f"🎯 *{habit.action}*\n"
-                message += f"   ⏰ {habit.time.strftime('%H:%M')}\n"
-                message += f"   📍 {habit.place}\n"
-                message += f"   🔄 раз в {habit.frequency} дней\n\n"
+        user = await self.get_user_by_chat_id(update.effective_chat.id)
+        if not user:
+            await query.edit_message_text("❌ Ваш аккаунт не привязан. Введите ваш email для привязки.")
+            return
+
+        _, direction, habit_id = query.data.split(":")
+        if direction == "next":
+            message, keyboard = await self.build_habits_page(user, after_id=int(habit_id))
         else:
-            message = "У вас пока нет привычек. Создайте их на сайте! 🌟"
+            message, keyboard = await self.build_habits_page(user, before_id=int(habit_id))
 
-        await update.message.reply_text(message, parse_mode="Markdown")
+        await query.edit_message_text(message, parse_mode="Markdown", reply_markup=keyboard)
 
     async def toggle_notifications(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Включить/выключить уведомления"""
         chat_id = update.effective_chat.id
 
-        user = await self.get_user_by_chat_id(chat_id)
+        user = await self.toggle_user_notifications(chat_id)
         if not user:
             await update.message.reply_text("❌ Ваш аккаунт не привязан. Введите ваш email для привязки.")
             return
 
-        user.telegram_notifications = not user.telegram_notifications
-        await self.save_user(user)
-
         status = "включены" if user.telegram_notifications else "выключены"
         await update.message.reply_text(
             f"🔔 Уведомления {status}!\n"
@@ -193,7 +286,79 @@ class HabitTrackerBot:
                 "/help - показать справку"
             )
 
+    async def process_webhook_update(self, data):
+        """Обработка обновления, пришедшего через webhook (с тем же ограничением параллельности, что и в polling)"""
+        update = Update.de_json(data, self.application.bot)
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+
+    async def set_webhook(self, url):
+        """Регистрация webhook в Telegram (обновления начнут приходить на url вместо polling)"""
+        async with self.application.bot:
+            await self.application.bot.set_webhook(
+                url=url, secret_token=settings.TELEGRAM_WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES
+            )
+
     def run(self):
         """Запуск бота"""
         logger.info("Starting Telegram bot...")
         self.application.run_polling()
+
+
+_webhook_bot = None
+_webhook_bot_lock = None
+_webhook_loop = None
+_webhook_loop_lock = threading.Lock()
+
+
+def get_webhook_loop():
+    """
+    Собственный event loop бота для webhook в фоновом потоке (один на процесс).
+    Application и его HTTP-клиент привязаны к loop, в котором инициализированы, а под WSGI (gunicorn)
+    async_to_sync создает новый loop на каждый запрос - поэтому бот живет в своем постоянном loop.
+    """
+    global _webhook_bot_lock, _webhook_loop
+
+    if _webhook_loop is None:
+        with _webhook_loop_lock:
+            if _webhook_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="telegram-webhook", daemon=True).start()
+                # Блокировка инициализации бота используется только в этом loop
+                _webhook_bot_lock = asyncio.Lock()
+                _webhook_loop = loop
+
+    return _webhook_loop
+
+
+async def get_webhook_bot():
+    """Инициализированный экземпляр бота для режима webhook; вызывается только в loop get_webhook_loop"""
+    global _webhook_bot
+
+    if _webhook_bot is None:
+        async with _webhook_bot_lock:
+            if _webhook_bot is None:
+                bot = HabitTrackerBot()
+                await bot.application.initialize()
+                _webhook_bot = bot
+
+    return _webhook_bot
+
+
+async def _process_webhook_update(data):
+    bot = await get_webhook_bot()
+    await bot.process_webhook_update(data)
+
+
+async def process_webhook_update(data):
+    """Обработка обновления webhook в loop бота; можно вызывать из любого event loop (ASGI или async_to_sync)"""
+    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_process_webhook_update(data), get_webhook_loop()))
+
+
+def reset_webhook_bot():
+    """После fork поток с loop бота остался в родителе - потомок создаст свой loop и бота"""
+    global _webhook_bot, _webhook_bot_lock, _webhook_loop
+
+    _webhook_bot = _webhook_bot_lock = _webhook_loop = None
+
+
+os.register_at_fork(after_in_child=reset_webhook_bot)
@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .metrics import record_message_outcome, record_telegram_response
+
+# Ключ кэша с моментом, до которого Telegram попросил не отправлять сообщения (общий для всех воркеров)
+THROTTLE_CACHE_KEY = "telegram_throttled_until"
+
+_session = None
+_session_lock = threading.Lock()
+
+# Event loop, httpx.AsyncClient и ограничители частоты пакетной отправки: свои в каждом потоке, живут между пакетами
+_async_state = threading.local()
+
+
+def get_api_url(method):
+    """URL метода Telegram Bot API"""
+    return f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/{method}"
+
+
+def get_timeout():
+    """Таймауты (подключение, чтение) для запросов к Telegram API"""
+    return settings.TELEGRAM_HTTP_CONNECT_TIMEOUT, settings.TELEGRAM_HTTP_READ_TIMEOUT
+
+
+def get_telegram_session():
+    """
+    Общая для процесса HTTP-сессия с пулом keep-alive соединений к Telegram API.
+    Создается лениво, поэтому каждый процесс Celery-воркера получает свой пул
+    и не платит за новое TCP+TLS соединение на каждое сообщение.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.TELEGRAM_HTTP_POOL_SIZE,
+                    max_retries=0,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+
+    return _session
+
+
+def reset_telegram_session():
+    """Закрытие пула соединений (после fork соединения родителя использовать нельзя)"""
+    global _session
+
+    if _session is not None:
+        _session.close()
+    _session = None
+
+
+def get_async_runner():
+    """
+    Постоянный event loop потока для пакетной отправки. asyncio.run создавал бы новый loop на каждый пакет,
+    а соединения httpx.AsyncClient привязаны к loop, поэтому пул keep-alive терялся бы между пакетами.
+    """
+    if getattr(_async_state, "runner", None) is None:
+        _async_state.runner = asyncio.Runner()
+    return _async_state.runner
+
+
+def make_telegram_async_client():
+    """httpx.AsyncClient с пулом на TELEGRAM_SEND_CONCURRENCY keep-alive соединений"""
+    concurrency = settings.TELEGRAM_SEND_CONCURRENCY
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.TELEGRAM_HTTP_READ_TIMEOUT, connect=settings.TELEGRAM_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+
+
+def get_telegram_async_client():
+    """Общий для потока httpx.AsyncClient; работает только в loop get_async_runner"""
+    if getattr(_async_state, "client", None) is None:
+        _async_state.client = make_telegram_async_client()
+    return _async_state.client
+
+
+def reset_telegram_async_client(close=True):
+    """
+    Закрытие пула пакетной отправки в текущем потоке.
+    После fork (close=False) соединения родителя только забываются: закрывать их в потомке нельзя.
+    """
+    runner = getattr(_async_state, "runner", None)
+    client = getattr(_async_state, "client", None)
+    _async_state.runner = _async_state.client = _async_state.limiters = None
+
+    if close and runner is not None:
+        if client is not None:
+            runner.run(client.aclose())
+        runner.close()
+
+
+os.register_at_fork(after_in_child=reset_telegram_session)
+os.register_at_fork(after_in_child=lambda: reset_telegram_async_client(close=False))
+
+
+def get_retry_after(response):
+    """Сколько секунд Telegram просит подождать (ответ 429), иначе None"""
+    if response.status_code != 429:
+        return None
+
+    try:
+        return int(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+def pause_sending(retry_after):
+    """Приостановить отправку во всех воркерах на retry_after секунд"""
+    cache.set(THROTTLE_CACHE_KEY, time.time() + retry_after, timeout=math.ceil(retry_after))
+
+
+def get_throttle_delay():
+    """Сколько секунд осталось до снятия общей паузы отправки"""
+    throttled_until = cache.get(THROTTLE_CACHE_KEY)
+    return max(0, throttled_until - time.time()) if throttled_until else 0
+
+
+class TokenBucket:
+    """Асинхронный ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться свободного токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def is_idle(self):
+        """Запас успел восстановиться полностью - ограничитель ничем не отличается от нового"""
+        return self.tokens + (time.monotonic() - self.updated_at) * self.rate >= self.capacity
+
+
+def make_rate_limiters():
+    """Глобальный ограничитель (TELEGRAM_GLOBAL_RATE_LIMIT) и ограничители по чатам (TELEGRAM_CHAT_RATE_LIMIT)"""
+    return (
+        TokenBucket(settings.TELEGRAM_GLOBAL_RATE_LIMIT),
+        defaultdict(lambda: TokenBucket(settings.TELEGRAM_CHAT_RATE_LIMIT, capacity=1)),
+    )
+
+
+def get_rate_limiters():
+    """
+    Общие для потока ограничители частоты; работают только в loop get_async_runner.
+    Живут между пакетами: новые ограничители на каждый пакет начинались бы с полного запаса токенов,
+    и пакеты подряд превышали бы лимиты Telegram.
+    """
+    if getattr(_async_state, "limiters", None) is None:
+        _async_state.limiters = make_rate_limiters()
+    return _async_state.limiters
+
+
+async def send_messages_bulk(messages, client=None, limiters=None):
+    """
+    Асинхронная отправка пакета сообщений [(chat_id, text), ...] в Telegram.
+    Одновременных запросов не больше TELEGRAM_SEND_CONCURRENCY, частота ограничена
+    глобально (TELEGRAM_GLOBAL_RATE_LIMIT) и для каждого чата (TELEGRAM_CHAT_RATE_LIMIT).
+    При ответе 429 отправка приостанавливается для всех воркеров, а в результате
+    сообщения указывается retry_after. Возвращает результаты в порядке входных сообщений.
+    client - общий httpx.AsyncClient с пулом соединений; без него создается клиент на один пакет.
+    limiters - общие ограничители частоты (make_rate_limiters); без них лимиты действуют в пределах пакета.
+    """
+    concurrency = settings.TELEGRAM_SEND_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    global_limiter, chat_limiters = limiters or make_rate_limiters()
+
+    # Ограничители чатов с полным запасом токенов не нужны - не копим их для всех чатов, что видел процесс
+    for chat_id in [chat_id for chat_id, limiter in chat_limiters.items() if limiter.is_idle()]:
+        del chat_limiters[chat_id]
+    url = get_api_url("sendMessage")
+
+    # Момент (по time.time), до которого отправка приостановлена; учитываем паузу других воркеров
+    throttled_until = {"value": time.time() + await asyncio.to_thread(get_throttle_delay)}
+
+    client_context = make_telegram_async_client() if client is None else contextlib.nullcontext(client)
+
+    async with client_context as client:
+
+        async def send_one(chat_id, text):
+            result = {"chat_id": chat_id, "ok": False, "status": None, "error": None, "retry_after": None}
+
+            # Сначала ждем лимит чата, чтобы не занимать глобальный токен впустую
+            await chat_limiters[chat_id].acquire()
+            await global_limiter.acquire()
+
+            async with semaphore:
+                delay = throttled_until["value"] - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"})
+                except httpx.HTTPError as e:
+                    record_telegram_response(None, time.perf_counter() - started)
+                    record_message_outcome("failed")
+                    result["error"] = str(e) or e.__class__.__name__
+                    return result
+
+            record_telegram_response(response.status_code, time.perf_counter() - started)
+            result["status"] = response.status_code
+            result["ok"] = response.status_code == 200
+            if result["ok"]:
+                record_message_outcome("sent")
+                return result
+
+            result["error"] = response.text
+            retry_after = get_retry_after(response)
+            if retry_after:
+                record_message_outcome("throttled")
+                result["retry_after"] = retry_after
+                throttled_until["value"] = max(throttled_until["value"], time.time() + retry_after)
+                await asyncio.to_thread(pause_sending, retry_after)
+            else:
+                record_message_outcome("failed")
+
+            return result
+
+        return await asyncio.gather(*(send_one(chat_id, text) for chat_id, text in messages))
+
+
+def send_messages_bulk_sync(messages):
+    """
+    Синхронная обертка над send_messages_bulk для Celery задач: пакеты идут через постоянный loop потока,
+    общий httpx.AsyncClient и общие ограничители частоты, поэтому соединения с Telegram переиспользуются,
+    а лимиты соблюдаются и между пакетами.
+    """
+    return get_async_runner().run(send_messages_bulk(messages, get_telegram_async_client(), get_rate_limiters()))
@@ -1 +1,1210 @@
-# Create your tests here.
+import asyncio
+import json
+import time as time_module
+import uuid
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from threading import get_ident
+from unittest import mock
+
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from user.models import User
+
+from . import renderers
+from .chat_cache import ChatUser, ChatUserCache, chat_user_cache
+from .management.commands.explain_habit_queries import get_hot_queries
+from .metrics import MetricsRegistry, metrics_store
+from .models import Habit, ReminderDelivery
+from .public_feed import PUBLIC_FEED_CACHE_KEY, get_public_feed_version
+from .renderers import FastJSONParser, FastJSONRenderer
+from .rendering import RenderCache, render_cache, render_habit_list_item, render_habit_reminder
+from .serializers import HabitRowSerializer, HabitSerializer, PublicHabitRowSerializer, PublicHabitSerializer
+from .tasks import (
+    REMINDER_NETWORK_RETRY_DELAY,
+    check_and_send_habit_reminders,
+    claim_reminders,
+    get_reminder_retry_delay,
+    send_habit_reminder_task,
+    send_habit_reminders_batch
+)
+from .telegram_bot import HabitTrackerBot, get_webhook_loop, reset_webhook_bot
+from .telegram_client import pause_sending, reset_telegram_async_client, send_messages_bulk_sync
+from .validators import validate_habit_rules
+
+
+def make_user(name, **extra):
+    return User.objects.create_user(username=name, email=f"{name}@example.com", password="password", **extra)
+
+
+def make_habit(user, **extra):
+    fields = {"place": "Дом", "time": time(8, 0), "action": "Зарядка", "duration": 60, **extra}
+    return Habit.objects.create(user=user, **fields)
+
+
+def telegram_response(status_code, json=None):
+    response = mock.Mock(status_code=status_code, text=str(json))
+    response.json.return_value = json or {}
+    return response
+
+
+class NextDueAtTimezoneTests(TestCase):
+    """Время напоминания считается в часовом поясе пользователя, в том числе через переход на летнее время"""
+
+    def make_habit(self, tz, **extra):
+        return Habit(user=User(timezone=tz), time=time(8, 0), frequency=1, **extra)
+
+    def test_new_schedule_in_user_timezone(self):
+        habit = self.make_habit("Asia/Tokyo")
+        after = datetime(2026, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+        # 08:00 в Токио (UTC+9) - 23:00 UTC предыдущего дня
+        self.assertEqual(habit.get_next_due_at(after=after), datetime(2026, 3, 1, 23, 0, tzinfo=dt_timezone.utc))
+
+    def test_spring_forward_keeps_local_time(self):
+        # В Нью-Йорке 8 марта 2026 часы переводятся вперед: 08:00 EST = 13:00 UTC, 08:00 EDT = 12:00 UTC
+        habit = self.make_habit("America/New_York")
+        after = datetime(2026, 3, 7, 14, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(habit.get_next_due_at(after=after), datetime(2026, 3, 8, 12, 0, tzinfo=dt_timezone.utc))
+
+    def test_fall_back_keeps_local_time(self):
+        # В Берлине 25 октября 2026 часы переводятся назад: 08:00 CEST = 06:00 UTC, 08:00 CET = 07:00 UTC
+        habit = self.make_habit("Europe/Berlin", next_due_at=datetime(2026, 10, 24, 6, 0, tzinfo=dt_timezone.utc))
+        after = datetime(2026, 10, 24, 6, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(habit.get_next_due_at(after=after), datetime(2026, 10, 25, 7, 0, tzinfo=dt_timezone.utc))
+
+    def test_time_in_spring_forward_gap(self):
+        # 02:30 8 марта в Нью-Йорке не существует - напоминание приходит через час после 01:30 EST, в 03:30 EDT
+        habit = Habit(user=User(timezone="America/New_York"), time=time(2, 30), frequency=1)
+        after = datetime(2026, 3, 7, 8, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(habit.get_next_due_at(after=after), datetime(2026, 3, 8, 7, 30, tzinfo=dt_timezone.utc))
+
+
+class NextDueAtFrequencyTests(TestCase):
+    """После напоминания расписание сдвигается на frequency дней, а не на сутки"""
+
+    def make_habit(self, **extra):
+        return Habit(user=User(timezone="Europe/Moscow"), time=time(8, 0), **extra)
+
+    def test_advances_by_frequency(self):
+        # 08:00 в Москве - 05:00 UTC
+        sent_at = datetime(2026, 3, 1, 5, 0, tzinfo=dt_timezone.utc)
+        habit = self.make_habit(frequency=3, next_due_at=sent_at)
+        self.assertEqual(habit.get_next_due_at(after=sent_at), datetime(2026, 3, 4, 5, 0, tzinfo=dt_timezone.utc))
+
+    def test_missed_reminders_keep_frequency_grid(self):
+        # Пропущенные напоминания 4, 7 и 10 марта не сбивают расписание: следующее - 13 марта
+        habit = self.make_habit(frequency=3, next_due_at=datetime(2026, 3, 1, 5, 0, tzinfo=dt_timezone.utc))
+        after = datetime(2026, 3, 10, 6, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(habit.get_next_due_at(after=after), datetime(2026, 3, 13, 5, 0, tzinfo=dt_timezone.utc))
+
+    def test_schedule_change_restarts_from_today(self):
+        habit = make_habit(make_user("frequency"), frequency=7)
+        first_due_at = habit.next_due_at
+        self.assertLessEqual(first_due_at - timezone.now(), timedelta(days=1))
+
+        habit.place = "Парк"
+        habit.save()
+        self.assertEqual(habit.next_due_at, first_due_at)
+
+        habit.next_due_at += timedelta(days=7)
+        habit.frequency = 2
+        habit.save()
+        self.assertEqual(habit.next_due_at, first_due_at)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test")
+class ReminderRetryTests(TestCase):
+    """Повтор напоминания: только 429 / общая пауза и сетевые ошибки, а не любые ответы Telegram"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("reminder", telegram_chat_id=100)
+        cls.habit = make_habit(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def run_task(self, post):
+        session = mock.Mock(post=post)
+        with (
+            mock.patch("habits.tasks.get_telegram_session", return_value=session),
+            mock.patch.object(send_habit_reminder_task, "retry") as retry,
+        ):
+            send_habit_reminder_task.apply(args=[self.habit.id])
+        return retry
+
+    def test_sent_message_is_not_retried(self):
+        retry = self.run_task(mock.Mock(return_value=telegram_response(200)))
+        retry.assert_not_called()
+
+    def test_client_errors_are_not_retried(self):
+        for status_code in (400, 403):
+            with self.subTest(status_code=status_code):
+                retry = self.run_task(mock.Mock(return_value=telegram_response(status_code)))
+                retry.assert_not_called()
+
+    def test_client_error_is_not_retried_during_foreign_pause(self):
+        """Пауза, выставленная другим воркером после этой отправки, не делает 403 повторяемым"""
+
+        def post(*args, **kwargs):
+            pause_sending(30)
+            return telegram_response(403)
+
+        retry = self.run_task(post)
+        retry.assert_not_called()
+
+    def test_too_many_requests_is_retried_after_retry_after(self):
+        retry = self.run_task(mock.Mock(return_value=telegram_response(429, {"parameters": {"retry_after": 7}})))
+        retry.assert_called_once_with(countdown=7, throw=False)
+
+    def test_active_pause_is_retried_without_request(self):
+        pause_sending(10)
+        post = mock.Mock()
+        retry = self.run_task(post)
+
+        post.assert_not_called()
+        self.assertEqual(retry.call_count, 1)
+        self.assertLessEqual(retry.call_args.kwargs["countdown"], 10)
+
+    def test_network_error_is_retried_with_backoff(self):
+        retry = self.run_task(mock.Mock(side_effect=requests.ConnectionError("connection reset")))
+        retry.assert_called_once_with(countdown=REMINDER_NETWORK_RETRY_DELAY, throw=False)
+
+    def test_network_retry_delay_doubles(self):
+        result = {"ok": False, "status": None, "error": "timeout", "retry_after": None}
+        self.assertEqual(get_reminder_retry_delay(result, 2), REMINDER_NETWORK_RETRY_DELAY * 4)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test", TELEGRAM_GLOBAL_RATE_LIMIT=20, TELEGRAM_CHAT_RATE_LIMIT=5)
+class BulkSendRateLimitTests(TestCase):
+    """Лимиты частоты пакетной отправки соблюдаются и между пакетами, а не только внутри одного"""
+
+    def setUp(self):
+        cache.clear()
+        self.sent_at = []
+
+        def handler(request):
+            self.sent_at.append(time_module.monotonic())
+            return httpx.Response(200, json={"ok": True})
+
+        transport = httpx.MockTransport(handler)
+        patcher = mock.patch(
+            "habits.telegram_client.make_telegram_async_client",
+            side_effect=lambda: httpx.AsyncClient(transport=transport),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(reset_telegram_async_client)
+
+    def test_consecutive_batches_share_global_limit(self):
+        # Запас токенов (20) уходит на первый пакет, второй ждет их восстановления
+        send_messages_bulk_sync([(chat_id, "Привет") for chat_id in range(20)])
+        send_messages_bulk_sync([(chat_id, "Привет") for chat_id in range(20, 40)])
+
+        self.assertEqual(len(self.sent_at), 40)
+        self.assertGreaterEqual(self.sent_at[-1] - self.sent_at[0], 0.9)
+
+    def test_consecutive_batches_share_chat_limit(self):
+        send_messages_bulk_sync([(1, "Первое")])
+        send_messages_bulk_sync([(1, "Второе")])
+
+        self.assertGreaterEqual(self.sent_at[1] - self.sent_at[0], 0.19)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test")
+class ReminderQueryCountTests(TestCase):
+    """Планировщик и отправка пакета делают постоянное число запросов, сколько бы привычек ни наступило"""
+
+    def make_due_habits(self, count):
+        user = make_user(f"due_{count}", telegram_chat_id=count)
+        reward = make_habit(user, action="Кофе", is_pleasant=True)
+        habits = [make_habit(user, related_habit=reward) for _ in range(count)]
+        Habit.objects.filter(id__in=[habit.id for habit in habits]).update(
+            next_due_at=timezone.now() - timedelta(minutes=1)
+        )
+        return habits
+
+    def assert_scheduler_queries(self, count):
+        self.make_due_habits(count)
+        with mock.patch("celery.group") as group, self.assertNumQueries(4):
+            check_and_send_habit_reminders()
+        group.return_value.apply_async.assert_called_once()
+
+    def test_scheduler_queries_do_not_depend_on_habit_count(self):
+        self.assert_scheduler_queries(2)
+        ReminderDelivery.objects.all().delete()
+        self.assert_scheduler_queries(20)
+
+    def assert_batch_queries(self, count):
+        habits = self.make_due_habits(count)
+        deliveries = [{"ok": True, "status": 200, "error": None, "retry_after": None}] * count
+        with (
+            mock.patch("habits.tasks.send_messages_bulk_sync", return_value=deliveries) as send,
+            self.assertNumQueries(2),
+        ):
+            send_habit_reminders_batch([habit.id for habit in habits], "00000000-0000-0000-0000-000000000000")
+        self.assertEqual(len(send.call_args.args[0]), count)
+
+    def test_batch_queries_do_not_depend_on_habit_count(self):
+        self.assert_batch_queries(2)
+        self.assert_batch_queries(20)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test")
+class ReminderBatchRetryTests(TestCase):
+    """Пакетная отправка повторяет те же ошибки, что и одиночная: 429 и сетевые, но не 4xx"""
+
+    def setUp(self):
+        user = make_user("batch_retry", telegram_chat_id=300)
+        self.habits = {action: make_habit(user, action=action) for action in ("Сеть", "Лимит", "Запрет")}
+
+    def run_batch(self, deliveries):
+        """deliveries - результат отправки по действию привычки (порядок в пакете не задан)"""
+
+        def send(messages):
+            return [next(deliveries[action] for action in deliveries if action in text) for _, text in messages]
+
+        with (
+            mock.patch("habits.tasks.send_messages_bulk_sync", side_effect=send),
+            mock.patch.object(send_habit_reminders_batch, "retry") as retry,
+        ):
+            send_habit_reminders_batch.apply(
+                args=[[habit.id for habit in self.habits.values()], "00000000-0000-0000-0000-000000000000"]
+            )
+        return retry
+
+    def test_network_errors_and_throttling_are_retried(self):
+        retry = self.run_batch(
+            {
+                "Сеть": {"ok": False, "status": None, "error": "connection reset", "retry_after": None},
+                "Лимит": {"ok": False, "status": 429, "error": "Too Many Requests", "retry_after": 7},
+                "Запрет": {"ok": False, "status": 403, "error": "Forbidden", "retry_after": None},
+            }
+        )
+
+        retry.assert_called_once()
+        retried_ids, claim_token = retry.call_args.kwargs["args"]
+        self.assertEqual(sorted(retried_ids), sorted([self.habits["Сеть"].id, self.habits["Лимит"].id]))
+        self.assertEqual(retry.call_args.kwargs["countdown"], 7)
+
+    def test_client_errors_are_not_retried(self):
+        error = {"ok": False, "status": 400, "error": "Bad Request", "retry_after": None}
+        retry = self.run_batch({action: error for action in self.habits})
+        retry.assert_not_called()
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test")
+class ReminderClaimTests(TestCase):
+    """Журнал ReminderDelivery: каждое напоминание захватывается и отправляется ровно один раз"""
+
+    def setUp(self):
+        user = make_user("claim", telegram_chat_id=500)
+        self.habits = [make_habit(user) for _ in range(3)]
+        self.due_at = timezone.now() - timedelta(minutes=1)
+        Habit.objects.filter(user=user).update(next_due_at=self.due_at)
+
+    def test_reminder_is_claimed_once(self):
+        habits = list(Habit.objects.filter(id__in=[habit.id for habit in self.habits]))
+        _, first = claim_reminders(habits)
+        _, second = claim_reminders(habits)
+
+        self.assertEqual(first, {habit.id for habit in self.habits})
+        self.assertEqual(second, set())
+        self.assertEqual(ReminderDelivery.objects.count(), 3)
+
+    def test_overlapping_scheduler_runs_send_once(self):
+        with mock.patch("celery.group") as group:
+            check_and_send_habit_reminders()
+            # Второй запуск прочитал привычки до того, как первый сдвинул next_due_at
+            Habit.objects.filter(id__in=[habit.id for habit in self.habits]).update(next_due_at=self.due_at)
+            result = check_and_send_habit_reminders()
+
+        group.assert_called_once()
+        self.assertEqual(result, "ℹ️ Напоминаний не найдено")
+
+    def test_batch_marks_only_sent_reminders(self):
+        blocked = self.habits[1]
+        Habit.objects.filter(id=blocked.id).update(action="Заблокирован")
+        claim_token, claimed_ids = claim_reminders(list(Habit.objects.filter(id__in=[h.id for h in self.habits])))
+
+        def send(messages):
+            return [
+                (
+                    {"ok": False, "status": 403, "error": "Forbidden", "retry_after": None}
+                    if "Заблокирован" in text
+                    else {"ok": True, "status": 200, "error": None, "retry_after": None}
+                )
+                for _, text in messages
+            ]
+
+        with mock.patch("habits.tasks.send_messages_bulk_sync", side_effect=send):
+            send_habit_reminders_batch(sorted(claimed_ids), str(claim_token))
+
+        sent = ReminderDelivery.objects.filter(is_sent=True).values_list("habit_id", flat=True)
+        self.assertEqual(sorted(sent), sorted(habit.id for habit in self.habits if habit != blocked))
+
+
+class RenderCacheTests(TestCase):
+    """Тексты сообщений рендерятся один раз на версию привычки (updated_at) и вытесняются по LRU"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("render")
+        cls.pleasant = make_habit(cls.user, action="Кофе", is_pleasant=True)
+        cls.habit = make_habit(cls.user, action="Зарядка <утром>", related_habit=cls.pleasant)
+
+    def setUp(self):
+        render_cache.clear()
+        self.addCleanup(render_cache.clear)
+
+    def test_hit_and_lru_eviction(self):
+        lru = RenderCache(maxsize=2)
+        render = mock.Mock(side_effect=lambda: "text")
+
+        self.assertEqual(lru.get_or_render("a", render), "text")
+        lru.get_or_render("a", render)
+        self.assertEqual(render.call_count, 1)
+
+        lru.get_or_render("b", render)
+        lru.get_or_render("a", render)
+        lru.get_or_render("c", render)  # вытесняет "b" - к нему дольше всех не обращались
+        lru.get_or_render("a", render)
+        self.assertEqual(render.call_count, 3)
+        lru.get_or_render("b", render)
+        self.assertEqual(render.call_count, 4)
+
+    def test_reminder_is_rendered_once(self):
+        habit = Habit.objects.select_related("related_habit").get(pk=self.habit.pk)
+        text = render_habit_reminder(habit)
+        self.assertIn("Зарядка &lt;утром&gt;", text)
+        self.assertIn("Связанная привычка: Кофе", text)
+
+        with mock.patch("habits.rendering.escape") as escape:
+            self.assertEqual(render_habit_reminder(habit), text)
+        escape.assert_not_called()
+
+    def test_update_changes_key(self):
+        habit = Habit.objects.select_related("related_habit").get(pk=self.habit.pk)
+        render_habit_reminder(habit)
+        self.assertIn("📍 Дом", render_habit_list_item(habit))
+
+        habit.place = "Парк"
+        habit.save()
+        self.assertIn("Место: Парк", render_habit_reminder(habit))
+        self.assertIn("📍 Парк", render_habit_list_item(habit))
+
+    def test_related_habit_update_changes_key(self):
+        habit = Habit.objects.select_related("related_habit").get(pk=self.habit.pk)
+        render_habit_reminder(habit)
+
+        self.pleasant.action = "Чай"
+        self.pleasant.save()
+        habit = Habit.objects.select_related("related_habit").get(pk=self.habit.pk)
+        self.assertIn("Связанная привычка: Чай", render_habit_reminder(habit))
+
+
+class ChatUserCacheTests(TestCase):
+    """Кэш chat_id → пользователь: память процесса, общий кэш, отрицательные записи и сброс между процессами"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("chat", telegram_chat_id=500)
+
+    def setUp(self):
+        cache.clear()
+        self.chat_cache = ChatUserCache(local_ttl=30, shared_ttl=60, version_check_interval=60)
+
+    def test_miss_then_hits(self):
+        with self.assertNumQueries(1):
+            user = self.chat_cache.get(500)
+        self.assertEqual(user, ChatUser(self.user.id, "chat", self.user.telegram_notifications))
+
+        self.assertEqual(self.chat_cache.get_local(500), (True, user))
+        # Другой процесс находит пользователя в общем кэше, без базы
+        with self.assertNumQueries(0):
+            self.assertEqual(ChatUserCache(30, 60, 60).get(500), user)
+
+    def test_unknown_chat_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.chat_cache.get(999))
+        self.assertEqual(self.chat_cache.get_local(999), (True, None))
+        with self.assertNumQueries(0):
+            self.assertIsNone(ChatUserCache(30, 60, 60).get(999))
+
+    def test_async_lookup(self):
+        user = async_to_sync(self.chat_cache.aget)(500)
+        self.assertEqual(user.username, "chat")
+        self.assertEqual(self.chat_cache.get_local(500), (True, user))
+
+    def test_invalidate_reaches_other_processes(self):
+        self.chat_cache.get(500)
+
+        # Сохранение пользователя в другом процессе сбрасывает общий кэш и меняет версию
+        self.user.username = "renamed"
+        self.user.save()
+
+        # До сверки версии процесс еще отвечает из памяти
+        self.assertEqual(self.chat_cache.get_local(500)[1].username, "chat")
+        with mock.patch("habits.chat_cache.time.monotonic", return_value=time_module.monotonic() + 60):
+            self.assertEqual(self.chat_cache.get_local(500), (False, None))
+            self.assertEqual(self.chat_cache.get(500).username, "renamed")
+
+    def test_local_entries_expire(self):
+        self.chat_cache.get(500)
+        with mock.patch("habits.chat_cache.time.monotonic", return_value=time_module.monotonic() + 31):
+            self.assertEqual(self.chat_cache.get_local(500), (False, None))
+
+
+class HotQueryIndexTests(TestCase):
+    """Горячие запросы к привычкам идут по индексам (EXPLAIN), а не полным просмотром таблицы"""
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == "postgresql":
+            # На пустой таблице PostgreSQL честно выбирает seq scan - проверяем, что индекс вообще применим
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        for name, queryset, expected_indexes in get_hot_queries(user_id=1):
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertTrue(any(index in plan for index in expected_indexes), plan)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test", TELEGRAM_WEBHOOK_SECRET="secret")
+class TelegramWebhookTests(TestCase):
+    """Webhook под WSGI: каждый запрос в новом event loop (async_to_sync), а бот один на процесс"""
+
+    def setUp(self):
+        reset_webhook_bot()
+
+    def tearDown(self):
+        loop = get_webhook_loop()
+        loop.call_soon_threadsafe(loop.stop)
+        reset_webhook_bot()
+
+    def post_update(self, body):
+        return self.client.post(
+            reverse("habits:telegram_webhook"),
+            body,
+            content_type="application/json",
+            headers={"X-Telegram-Bot-Api-Secret-Token": "secret"},
+        )
+
+    def test_bot_is_initialized_once_for_all_requests(self):
+        with (
+            mock.patch("telegram.ext.Application.initialize") as initialize,
+            mock.patch("telegram.ext.Application.process_update") as process_update,
+        ):
+            for update_id in (1, 2, 3):
+                response = self.post_update({"update_id": update_id})
+                self.assertEqual(response.status_code, 200)
+
+        initialize.assert_awaited_once()
+        self.assertEqual([call.args[0].update_id for call in process_update.await_args_list], [1, 2, 3])
+
+    def test_update_must_be_json_object(self):
+        for body in ("[]", "1", '"update"', "null"):
+            with self.subTest(body=body):
+                self.assertEqual(self.post_update(body).status_code, 400)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test", TELEGRAM_HABITS_PAGE_SIZE=2)
+class BotHabitsPageTests(TestCase):
+    """Листание /my_habits кнопками: keyset-пагинация по id полезных привычек владельца"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("pages", telegram_chat_id=700)
+        cls.habits = [make_habit(cls.user, action=f"Привычка {i}") for i in range(5)]
+        make_habit(cls.user, action="Приятная", is_pleasant=True)
+        make_habit(make_user("stranger"), action="Чужая")
+
+    def setUp(self):
+        cache.clear()
+        chat_user_cache.clear()
+        self.bot = HabitTrackerBot()
+
+    def press(self, callback_data, chat_id=700):
+        query = mock.Mock(data=callback_data, answer=mock.AsyncMock(), edit_message_text=mock.AsyncMock())
+        update = mock.Mock(callback_query=query, effective_chat=mock.Mock(id=chat_id))
+        async_to_sync(self.bot.my_habits_page)(update, None)
+        query.answer.assert_awaited_once()
+        call = query.edit_message_text.await_args
+        return call.args[0], call.kwargs.get("reply_markup")
+
+    def assert_page(self, page, habits, buttons):
+        message, keyboard = page
+        self.assertEqual(
+            [line for line in message.splitlines() if line.startswith("🎯")],
+            [f"🎯 *{habit.action}*" for habit in habits],
+        )
+        callbacks = [button.callback_data for button in keyboard.inline_keyboard[0]] if keyboard else []
+        self.assertEqual(callbacks, buttons)
+
+    def test_first_page(self):
+        page = async_to_sync(self.bot.build_habits_page)(chat_user_cache.get(700))
+        self.assert_page(page, self.habits[:2], [f"habits:next:{self.habits[1].id}"])
+
+    def test_next_and_prev(self):
+        h = self.habits
+        self.assert_page(
+            self.press(f"habits:next:{h[1].id}"), h[2:4], [f"habits:prev:{h[2].id}", f"habits:next:{h[3].id}"]
+        )
+        self.assert_page(self.press(f"habits:next:{h[3].id}"), h[4:], [f"habits:prev:{h[4].id}"])
+        self.assert_page(
+            self.press(f"habits:prev:{h[4].id}"), h[2:4], [f"habits:prev:{h[2].id}", f"habits:next:{h[3].id}"]
+        )
+        self.assert_page(self.press(f"habits:prev:{h[2].id}"), h[:2], [f"habits:next:{h[1].id}"])
+
+    def test_page_of_deleted_habits_falls_back_to_first(self):
+        self.assert_page(
+            self.press(f"habits:next:{self.habits[-1].id}"), self.habits[:2], [f"habits:next:{self.habits[1].id}"]
+        )
+
+    def test_unlinked_chat(self):
+        message, _ = self.press(f"habits:next:{self.habits[1].id}", chat_id=701)
+        self.assertIn("не привязан", message)
+
+
+class HabitListApiTests(TestCase):
+    """Списки привычек: курсорная пагинация по (-created_at, -id) или по ?ordering= с id в конце"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("owner")
+        cls.habits = [make_habit(cls.user, time=time(hour, 0)) for hour in (9, 7, 8, 7, 6)]
+        # Одинаковое created_at: порядок страниц держится на id
+        Habit.objects.filter(user=cls.user).update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_all_pages(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [habit["id"] for habit in data["results"]]
+            url = data["next"]
+        return ids
+
+    def test_pages_follow_created_at_and_id(self):
+        expected = sorted((habit.id for habit in self.habits), reverse=True)
+        self.assertEqual(self.get_all_pages(reverse("habits:api-habit-list") + "?page_size=2"), expected)
+
+    def test_ordering_by_non_unique_field_uses_id_tiebreaker(self):
+        url = reverse("habits:api-habit-list") + "?page_size=2&ordering=time"
+        expected = [habit.id for habit in sorted(self.habits, key=lambda habit: (habit.time, habit.id))]
+        self.assertEqual(self.get_all_pages(url), expected)
+
+        url = reverse("habits:api-habit-list") + "?page_size=2&ordering=-time"
+        expected = [habit.id for habit in sorted(self.habits, key=lambda habit: (habit.time, habit.id), reverse=True)]
+        self.assertEqual(self.get_all_pages(url), expected)
+
+    def test_public_list_ordering_uses_id_tiebreaker(self):
+        Habit.objects.filter(user=self.user).update(is_public=True)
+        self.client.force_login(make_user("reader"))
+
+        url = reverse("habits:api-public-habits") + "?page_size=2&ordering=time"
+        expected = [habit.id for habit in sorted(self.habits, key=lambda habit: (habit.time, habit.id))]
+        self.assertEqual(self.get_all_pages(url), expected)
+
+    def test_unknown_ordering_field_is_ignored(self):
+        url = reverse("habits:api-habit-list") + "?page_size=2&ordering=reward"
+        self.assertEqual(self.get_all_pages(url), sorted((habit.id for habit in self.habits), reverse=True))
+
+
+class HabitListCacheInvalidationTests(TestCase):
+    """Закэшированный список привычек обновляется после создания, изменения и удаления через API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("list_cache")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_list(self):
+        return [
+            (habit["id"], habit["place"])
+            for habit in self.client.get(reverse("habits:api-habit-list")).json()["results"]
+        ]
+
+    def change(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, content_type="application/json")
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def test_list_follows_changes(self):
+        self.assertEqual(self.get_list(), [])
+
+        data = {"place": "Дом", "time": "08:00", "action": "Зарядка", "duration": 60}
+        habit_id = self.change("post", reverse("habits:api-habit-list"), data).json()["id"]
+        self.assertEqual(self.get_list(), [(habit_id, "Дом")])
+
+        self.change("patch", reverse("habits:api-habit-detail", args=[habit_id]), {"place": "Парк"})
+        self.assertEqual(self.get_list(), [(habit_id, "Парк")])
+
+        self.change("delete", reverse("habits:api-habit-detail", args=[habit_id]))
+        self.assertEqual(self.get_list(), [])
+
+    def test_caches_are_invalidated_after_delete(self):
+        habit = make_habit(self.user, is_public=True)
+        seen = []
+
+        def habit_exists(*args):
+            seen.append(Habit.objects.filter(pk=habit.pk).exists())
+
+        with (
+            mock.patch("habits.list_cache.bump_habit_list_version", side_effect=habit_exists),
+            mock.patch("habits.public_feed.invalidate_public_feed", side_effect=habit_exists),
+        ):
+            habit.delete()
+
+        self.assertEqual(seen, [False, False])
+
+
+class HabitETagTests(TestCase):
+    """Условные GET: 304 при совпадении If-None-Match, новый ETag после изменения привычки или связанной привычки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("etag")
+        cls.pleasant = make_habit(cls.user, action="Кофе", is_pleasant=True)
+        cls.habit = make_habit(cls.user, related_habit=cls.pleasant)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assert_not_modified(self, url):
+        """ETag ответа; повторный запрос с ним получает 304 без тела"""
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+        return etag
+
+    def change(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    def test_list(self):
+        url = reverse("habits:api-habit-list")
+        etag = self.assert_not_modified(url)
+
+        self.change(
+            lambda: self.client.patch(
+                reverse("habits:api-habit-detail", args=[self.habit.pk]),
+                {"place": "Парк"},
+                content_type="application/json",
+            )
+        )
+        self.assertNotEqual(self.assert_not_modified(url), etag)
+
+    def test_detail(self):
+        url = reverse("habits:api-habit-detail", args=[self.habit.pk])
+        etag = self.assert_not_modified(url)
+
+        self.change(lambda: self.client.patch(url, {"place": "Парк"}, content_type="application/json"))
+        updated_etag = self.assert_not_modified(url)
+        self.assertNotEqual(updated_etag, etag)
+
+        # SET_NULL при удалении связанной привычки не меняет updated_at, но меняет ответ
+        self.change(lambda: self.client.delete(reverse("habits:api-habit-detail", args=[self.pleasant.pk])))
+        self.assertNotEqual(self.assert_not_modified(url), updated_etag)
+
+    def test_stale_etag_gets_full_response(self):
+        url = reverse("habits:api-habit-detail", args=[self.habit.pk])
+        response = self.client.get(url, headers={"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], self.habit.pk)
+
+
+class HabitRowSerializerTests(TestCase):
+    """Быстрые сериализаторы по строкам values() отдают тот же формат, что и ModelSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("author")
+        reward = make_habit(cls.user, action="Кофе", is_pleasant=True, time=time(7, 30, 15), is_public=True)
+        make_habit(cls.user, related_habit=reward, frequency=3, duration=120, is_public=True)
+        make_habit(cls.user, reward="Прогулка 🚶", time=time(23, 59))
+
+    def assert_same_format(self, serializer_class, row_serializer_class):
+        queryset = Habit.objects.order_by("-created_at", "-id")
+        rows = row_serializer_class.get_rows(queryset)
+        self.assertEqual(row_serializer_class(rows, many=True).data, serializer_class(queryset, many=True).data)
+
+    def test_row_serializers_match_model_serializers(self):
+        for tz in ("UTC", "Europe/Moscow", "America/New_York"):
+            with self.subTest(tz=tz), timezone.override(tz):
+                self.assert_same_format(HabitSerializer, HabitRowSerializer)
+                self.assert_same_format(PublicHabitSerializer, PublicHabitRowSerializer)
+
+
+class HabitListQueryCountTests(TestCase):
+    """
+    Списки привычек делают постоянное число запросов, сколько бы привычек ни было на странице:
+    сессия + пользователь + одна выборка страницы (или ленты); из кэша - без выборки.
+    """
+
+    def make_habits(self, count):
+        owner, author = make_user(f"owner_{count}"), make_user(f"author_{count}")
+        for _ in range(count):
+            make_habit(owner, is_public=True)
+            make_habit(author, is_public=True)
+        self.client.force_login(owner)
+        # Кэши сбрасываются в on_commit, а он не срабатывает внутри TestCase
+        cache.clear()
+
+    def assert_list_queries(self, url, count):
+        self.make_habits(count)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), min(count, 10))
+        return response
+
+    def test_own_list_queries_do_not_depend_on_habit_count(self):
+        url = reverse("habits:api-habit-list") + "?page_size=10"
+        for count in (2, 20):
+            with self.subTest(count=count):
+                self.assert_list_queries(url, count)
+                with self.assertNumQueries(2):
+                    self.client.get(url)
+
+    def test_public_feed_queries_do_not_depend_on_habit_count(self):
+        url = reverse("habits:api-public-habits") + "?page_size=10"
+        for count in (2, 20):
+            with self.subTest(count=count):
+                self.assert_list_queries(url, count)
+                with self.assertNumQueries(2):
+                    self.client.get(url)
+
+    def test_ordered_public_list_queries_do_not_depend_on_habit_count(self):
+        url = reverse("habits:api-public-habits") + "?page_size=10&ordering=time"
+        for count in (2, 20):
+            with self.subTest(count=count):
+                self.assert_list_queries(url, count)
+
+
+class HabitRulesTests(TestCase):
+    """Правила привычки: ошибки по полям из validate_habit_rules, в API и CHECK-ограничения в БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("rules")
+        cls.pleasant = make_habit(cls.user, is_pleasant=True)
+
+    def rules(self, **values):
+        fields = {"is_pleasant": False, "reward": None, "related_habit_id": None, "duration": 60, "frequency": 1}
+        return validate_habit_rules(**{**fields, **values})
+
+    def test_validate_habit_rules(self):
+        self.assertEqual(self.rules(), {})
+        self.assertEqual(set(self.rules(reward="Торт", related_habit_id=1)), {"reward", "related_habit"})
+        self.assertEqual(set(self.rules(related_habit_id=1, related_is_pleasant=False)), {"related_habit"})
+        # Признак связанной привычки неизвестен - правило пропускается, а не читает БД
+        self.assertEqual(self.rules(related_habit_id=1), {})
+        self.assertEqual(set(self.rules(is_pleasant=True, reward="Торт")), {"reward"})
+        self.assertEqual(set(self.rules(is_pleasant=True, related_habit_id=1)), {"related_habit"})
+        self.assertEqual(set(self.rules(duration=121)), {"duration"})
+        self.assertEqual(self.rules(is_pleasant=True, duration=600), {})
+        self.assertEqual(set(self.rules(frequency=8)), {"frequency"})
+
+    def test_model_and_api_errors_are_keyed_by_field(self):
+        habit = Habit(user=self.user, place="Дом", time=time(8, 0), action="Зарядка", duration=200, frequency=8)
+        with self.assertRaises(DjangoValidationError) as raised:
+            habit.save()
+        self.assertEqual(set(raised.exception.message_dict), {"duration", "frequency"})
+
+        self.client.force_login(self.user)
+        data = {"place": "Дом", "time": "08:00", "action": "Зарядка", "duration": 60, "reward": "Торт"}
+        response = self.client.post(
+            reverse("habits:api-habit-list"),
+            {**data, "related_habit": self.pleasant.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"reward", "related_habit"})
+
+    def test_constraints_reject_bulk_writes(self):
+        habit = make_habit(self.user)
+        changes = [
+            {"frequency": 8},
+            {"duration": 121},
+            {"reward": "Торт", "related_habit": self.pleasant},
+            {"is_pleasant": True, "reward": "Торт"},
+        ]
+        for change in changes:
+            with self.subTest(change=change), self.assertRaises(IntegrityError), transaction.atomic():
+                Habit.objects.filter(pk=habit.pk).update(**change)
+
+
+class HabitRuleConstraintsMigrationTests(TransactionTestCase):
+    """Миграция 0008 исправляет привычки, нарушающие правила, до добавления CHECK-ограничений"""
+
+    migrate_from = [("habits", "0007_habit_access_pattern_indexes")]
+    migrate_to = [("habits", "0008_habit_rule_constraints")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_existing_rows_are_fixed(self):
+        apps = self.migrate(self.migrate_from)
+        # Откатываются только миграции привычек - пользователь создается текущей моделью
+        user = make_user("legacy")
+        Habit = apps.get_model("habits", "Habit")
+        fields = {"user_id": user.pk, "place": "Дом", "time": time(8, 0), "action": "Зарядка", "duration": 60}
+        pleasant = Habit.objects.create(**fields, is_pleasant=True, reward="Торт")
+        both = Habit.objects.create(**fields, reward="Торт", related_habit=pleasant)
+        long = Habit.objects.create(**{**fields, "duration": 300}, frequency=10)
+        long_pleasant = Habit.objects.create(**{**fields, "duration": 300}, is_pleasant=True)
+
+        Habit = self.migrate(self.migrate_to).get_model("habits", "Habit")
+
+        pleasant = Habit.objects.get(pk=pleasant.pk)
+        self.assertEqual((pleasant.reward, pleasant.related_habit_id), (None, None))
+        both = Habit.objects.get(pk=both.pk)
+        self.assertEqual((both.reward, both.related_habit_id), ("Торт", None))
+        self.assertEqual(Habit.objects.filter(pk=long.pk).values_list("duration", "frequency").get(), (120, 7))
+        self.assertEqual(Habit.objects.get(pk=long_pleasant.pk).duration, 300)
+
+
+class HabitBulkApiTests(TestCase):
+    """Пакетное API: ошибки по элементам, чужие привычки и проверка правил без запроса на каждый элемент"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("bulk")
+        cls.pleasant = make_habit(cls.user, action="Кофе", is_pleasant=True)
+        cls.habits = [make_habit(cls.user, action=f"Привычка {i}", related_habit=cls.pleasant) for i in range(20)]
+        cls.foreign = make_habit(make_user("bulk_stranger"))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post(reverse("habits:api-habit-bulk"), data, content_type="application/json")
+
+    def test_item_errors_are_reported_by_field(self):
+        item = {"place": "Дом", "time": "08:00", "action": "Зарядка", "duration": 60}
+        response = self.post(
+            {
+                "create": [
+                    item,
+                    {**item, "duration": 200},
+                    {**item, "reward": "Торт", "related_habit": self.pleasant.id},
+                ],
+                "update": [{"id": self.habits[0].id, "frequency": 8}],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        errors = {(error["operation"], error["index"]): error["errors"] for error in response.json()["errors"]}
+        self.assertEqual(set(errors), {("create", 1), ("create", 2), ("update", 0)})
+        self.assertIn("duration", errors["create", 1])
+        self.assertEqual(set(errors["create", 2]), {"reward", "related_habit"})
+        self.assertIn("frequency", errors["update", 0])
+        # Пакет с ошибкой не сохраняется целиком
+        self.assertEqual(Habit.objects.filter(user=self.user).count(), 21)
+
+    def test_unknown_and_foreign_ids(self):
+        response = self.post(
+            {
+                "update": [{"id": self.foreign.id, "place": "Парк"}],
+                "delete": [self.foreign.id + 1000, self.habits[0].id],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        errors = [(error["operation"], error["index"], error["errors"]) for error in response.json()["errors"]]
+        not_found = {"id": ["Привычка не найдена"]}
+        self.assertEqual(errors, [("update", 0, not_found), ("delete", 0, not_found)])
+        self.assertTrue(Habit.objects.filter(pk=self.habits[0].pk).exists())
+        self.assertEqual(Habit.objects.get(pk=self.foreign.pk).place, "Дом")
+
+    def test_update_checks_existing_related_habit(self):
+        response = self.post({"update": [{"id": self.habits[0].id, "reward": "Торт"}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"][0]["errors"]), {"reward", "related_habit"})
+
+        Habit.objects.filter(pk=self.pleasant.pk).update(is_pleasant=False)
+        response = self.post({"update": [{"id": self.habits[0].id, "place": "Парк"}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("related_habit", response.json()["errors"][0]["errors"])
+
+    def test_update_query_count_does_not_grow_with_items(self):
+        # Сессия и пользователь, загрузка пакета, bulk_update и savepoint транзакции (создание и освобождение)
+        for habits in (self.habits[:2], self.habits):
+            with self.subTest(items=len(habits)), self.assertNumQueries(6):
+                response = self.post({"update": [{"id": habit.id, "place": "Парк"} for habit in habits]})
+            self.assertEqual(response.status_code, 200, response.content)
+
+        self.assertEqual(
+            set(Habit.objects.filter(pk__in=[h.pk for h in self.habits]).values_list("place", flat=True)), {"Парк"}
+        )
+
+
+@override_settings(PUBLIC_FEED_CACHE_SIZE=7, PUBLIC_FEED_CHUNK_SIZE=3)
+class PublicFeedTests(TestCase):
+    """Публичная лента: в кэше первые PUBLIC_FEED_CACHE_SIZE записей кусками, глубже - из БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer, cls.author = make_user("viewer"), make_user("feed_author")
+        for i in range(12):
+            make_habit(cls.author, is_public=True, action=f"Привычка {i}")
+            if i % 4 == 0:
+                make_habit(cls.viewer, is_public=True)
+                make_habit(cls.author, action="Скрытая")
+        # Часть привычек с одинаковым created_at: порядок внутри держится на id
+        Habit.objects.filter(id__in=Habit.objects.order_by("id").values("id")[:6]).update(created_at=timezone.now())
+        cls.expected = list(
+            Habit.objects.filter(is_public=True, user=cls.author)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([habit["id"] for habit in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_pages_forward_and_back(self):
+        pages = self.walk(reverse("habits:api-public-habits") + "?page_size=2", "next")
+        self.assertEqual([habit_id for page in pages for habit_id in page], self.expected)
+
+        last_page = self.client.get(reverse("habits:api-public-habits") + "?page_size=2").json()
+        while last_page["next"]:
+            last_page = self.client.get(last_page["next"]).json()
+        back = self.walk(last_page["previous"], "previous")
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_cache_holds_bounded_payload_chunks(self):
+        self.client.get(reverse("habits:api-public-habits"))
+
+        version = get_public_feed_version()
+        index = cache.get(PUBLIC_FEED_CACHE_KEY.format(version=version, part="index"))
+        chunks = [cache.get(PUBLIC_FEED_CACHE_KEY.format(version=version, part=number)) for number in range(3)]
+
+        self.assertFalse(index["complete"])
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertIsNone(cache.get(PUBLIC_FEED_CACHE_KEY.format(version=version, part=3)))
+        for entry in (entry for chunk in chunks for entry in chunk):
+            self.assertEqual(set(entry), {"id", "user_id", "position", "payload"})
+            self.assertIsInstance(entry["payload"], dict)
+
+
+class PublicFeedInvalidationTests(TestCase):
+    """Лента сбрасывается только изменениями, которые в ней видны"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("invalidation")
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_feed_reset(self, expected, change):
+        version = get_public_feed_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(get_public_feed_version() != version, expected)
+
+    def test_private_habit_changes_keep_feed(self):
+        habit = make_habit(self.user)
+        self.assert_feed_reset(False, lambda: make_habit(self.user))
+        habit = Habit.objects.get(pk=habit.pk)
+        habit.action = "Бег"
+        self.assert_feed_reset(False, habit.save)
+        self.assert_feed_reset(False, habit.delete)
+
+    def test_public_habit_changes_reset_feed(self):
+        habit = Habit.objects.get(pk=make_habit(self.user).pk)
+        habit.is_public = True
+        self.assert_feed_reset(True, habit.save)
+        habit = Habit.objects.get(pk=habit.pk)
+        habit.is_public = False
+        self.assert_feed_reset(True, habit.save)
+        self.assert_feed_reset(False, habit.save)
+
+    def test_bulk_changes_reset_feed_only_for_public_habits(self):
+        self.client.force_login(self.user)
+        url = reverse("habits:api-habit-bulk")
+        item = {"place": "Дом", "time": "08:00", "action": "Зарядка", "duration": 60}
+
+        def post(data):
+            return lambda: self.assertEqual(
+                self.client.post(url, data, content_type="application/json").status_code, 200
+            )
+
+        self.assert_feed_reset(False, post({"create": [item]}))
+        self.assert_feed_reset(True, post({"create": [{**item, "is_public": True}]}))
+        public_id = Habit.objects.get(is_public=True).id
+        self.assert_feed_reset(True, post({"delete": [public_id]}))
+
+    def test_username_change_resets_feed_only_for_public_authors(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "renamed"
+        self.assert_feed_reset(False, user.save)
+
+        make_habit(user, is_public=True)
+        user.username = "renamed_again"
+        self.assert_feed_reset(True, user.save)
+        self.assert_feed_reset(False, user.save)
+
+
+class SharedMetricsTests(TestCase):
+    """Метрики разных процессов (web и Celery) складываются в общем хранилище"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_metrics_of_all_processes_are_rendered(self):
+        web, worker = MetricsRegistry(), MetricsRegistry()
+        web.inc("habit_cache_requests_total", cache="habit_list", result="hit")
+        worker.inc("telegram_messages_total", outcome="sent", value=2)
+        worker.observe("telegram_request_duration_seconds", 0.03, status="200")
+        worker.flush()
+
+        rendered = web.render_prometheus()
+
+        self.assertIn('habit_cache_requests_total{cache="habit_list",result="hit"} 1', rendered)
+        self.assertIn('telegram_messages_total{outcome="sent"} 2', rendered)
+        self.assertIn('telegram_request_duration_seconds_bucket{status="200",le="0.05"} 1', rendered)
+        self.assertIn('telegram_request_duration_seconds_count{status="200"} 1', rendered)
+
+    def test_flush_sends_only_new_increments(self):
+        registry = MetricsRegistry()
+        registry.inc("telegram_messages_total", outcome="sent")
+        registry.flush()
+        registry.flush()
+
+        self.assertEqual(list(metrics_store.read().values()), [1])
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_increments_are_flushed_after_interval(self):
+        MetricsRegistry().inc("telegram_messages_total", outcome="failed")
+        self.assertEqual(list(metrics_store.read().values()), [1])
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_flush_inside_event_loop_runs_in_thread_pool(self):
+        flush_threads = []
+
+        async def send():
+            registry.inc("telegram_messages_total", outcome="sent")
+
+        registry = MetricsRegistry()
+        with mock.patch.object(metrics_store, "increment", side_effect=lambda _: flush_threads.append(get_ident())):
+            # asyncio.run дожидается задач пула потоков loop при закрытии
+            asyncio.run(send())
+
+        self.assertEqual(len(flush_threads), 1)
+        self.assertNotEqual(flush_threads[0], get_ident())
+
+
+@override_settings(METRICS_TOKEN="scrape-token")
+class MetricsViewTests(TestCase):
+    """Метрики доступны персоналу и Prometheus с токеном, остальным - 404"""
+
+    def test_bearer_token(self):
+        response = self.client.get(reverse("habits:metrics"), headers={"Authorization": "Bearer scrape-token"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_wrong_or_missing_token(self):
+        for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": "Basic scrape-token"}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.client.get(reverse("habits:metrics"), headers=headers).status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_no_token_configured(self):
+        self.assertEqual(
+            self.client.get(reverse("habits:metrics"), headers={"Authorization": "Bearer "}).status_code, 404
+        )
+
+    def test_staff_session(self):
+        self.client.force_login(make_user("staff", is_staff=True))
+        self.assertEqual(self.client.get(reverse("habits:metrics")).status_code, 200)
+
+
+class FastJSONTests(TestCase):
+    """orjson-рендерер и парсер дают тот же JSON, что и стандартные JSONRenderer и JSONParser DRF"""
+
+    data = {
+        "created_at": datetime(2026, 3, 1, 5, 0, 0, 123456, tzinfo=dt_timezone.utc),
+        "time": time(8, 30),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "amount": Decimal("1.50"),
+        "duration": timedelta(minutes=2),
+        "label": gettext_lazy("Привычка"),
+        "counts": {1: "один"},
+        "text": "строка\u2028с разделителем",
+    }
+
+    def test_renderer_matches_drf(self):
+        fast = FastJSONRenderer().render(self.data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(self.data)))
+        self.assertIn(b'"2026-03-01T05:00:00.123456Z"', fast)
+        self.assertIn(b"\\u2028", fast)
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_indent_and_missing_orjson_use_drf_renderer(self):
+        expected = JSONRenderer().render(self.data, renderer_context={"indent": 2})
+        self.assertEqual(FastJSONRenderer().render(self.data, renderer_context={"indent": 2}), expected)
+        with mock.patch("habits.renderers.orjson", None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_parser(self):
+        body = '{"place": "Дом", "duration": 60, "reward": null}'.encode()
+        for orjson_module in (renderers.orjson, None):
+            with self.subTest(orjson=orjson_module), mock.patch("habits.renderers.orjson", orjson_module):
+                self.assertEqual(
+                    FastJSONParser().parse(BytesIO(body)), {"place": "Дом", "duration": 60, "reward": None}
+                )
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(BytesIO(b'{"place": '))
+
+    def test_api_round_trip(self):
+        user = make_user("json")
+        self.client.force_login(user)
+        data = {"place": "Дом\u2028Сад", "time": "08:00", "action": "Зарядка", "duration": 60}
+
+        response = self.client.post(reverse("habits:api-habit-list"), data, content_type="application/json")
+
+        self.assertEqual(response.status_code, 201)
+        # Разделитель строк экранирован в теле ответа, но разбирается обратно в тот же символ
+        self.assertIn('"Дом\\u2028Сад"'.encode(), response.content)
+        self.assertEqual(response.json()["place"], "Дом\u2028Сад")
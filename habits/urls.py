@@ -1,14 +1,17 @@
 from django.urls import path
 
 from .views import (
+    HabitBulkView,
     HabitDetailView,
     HabitListCreateView,
     HabitListView,
     HabitRetrieveUpdateDestroyView,
+    MetricsView,
     NotificationsView,
     PublicHabitListView,
     PublicHabitsHTMLView,
     SendTestNotificationView,
+    TelegramWebhookView,
     TestHabitReminderView,
     ToggleNotificationsView
 )
@@ -18,11 +21,14 @@ app_name = "habits"
 # API endpoints
 api_urlpatterns = [
     path("api/habits/", HabitListCreateView.as_view(), name="api-habit-list"),
+    path("api/habits/bulk/", HabitBulkView.as_view(), name="api-habit-bulk"),
     path("api/habits/<int:pk>/", HabitRetrieveUpdateDestroyView.as_view(), name="api-habit-detail"),
     path("api/habits/public/", PublicHabitListView.as_view(), name="api-public-habits"),
     path("api/notifications/test/", SendTestNotificationView.as_view(), name="send_test_notification"),
     path("api/notifications/test-habit/", TestHabitReminderView.as_view(), name="test_habit_reminder"),
     path("api/notifications/toggle/", ToggleNotificationsView.as_view(), name="toggle_notifications"),
+    path("api/metrics/", MetricsView.as_view(), name="metrics"),
+    path("telegram/webhook/", TelegramWebhookView.as_view(), name="telegram_webhook"),
 ]
 
 # HTML endpoints
@@ -1,5 +1,9 @@
 from django.core.exceptions import ValidationError
 
+# Ограничения привычек: проверяются в validate_habit_rules и дублируются CHECK-ограничениями в БД
+USEFUL_HABIT_MAX_DURATION = 120
+HABIT_MAX_FREQUENCY = 7
+
 
 def validate_habit_duration(value, is_pleasant=False):
     """
@@ -7,7 +11,7 @@ def validate_habit_duration(value, is_pleasant=False):
     Полезная привычка: не больше 120 секунд
     Приятная привычка: без ограничений
     """
-    if not is_pleasant and value > 120:
+    if not is_pleasant and value > USEFUL_HABIT_MAX_DURATION:
         raise ValidationError(
             "Время выполнения полезной привычки должно быть не больше 120 секунд",
             params={"value": value},
@@ -16,8 +20,43 @@ def validate_habit_duration(value, is_pleasant=False):
 
 def validate_habit_frequency(value):
     """Валидатор для периодичности (не реже 1 раза в 7 дней)"""
-    if value > 7:
+    if value > HABIT_MAX_FREQUENCY:
         raise ValidationError(
             "Нельзя выполнять привычку реже, чем 1 раз в 7 дней",
             params={"value": value},
         )
+
+
+def validate_habit_rules(is_pleasant, reward, related_habit_id, duration, frequency, related_is_pleasant=None):
+    """
+    Общие правила привычки для модели, сериализатора и пакетного API.
+    Работает только с переданными значениями и не обращается к БД: признак приятности
+    связанной привычки проверяется, только если он известен (related_is_pleasant не None).
+    Возвращает словарь {поле: сообщение}, пустой - если ошибок нет.
+    """
+    errors = {}
+
+    # 1. Исключить одновременный выбор связанной привычки и указания вознаграждения
+    if related_habit_id and reward:
+        errors["reward"] = "Нельзя указывать одновременно и связанную привычку, и вознаграждение"
+        errors["related_habit"] = "Нельзя указывать одновременно и связанную привычку, и вознаграждение"
+
+    # 2. В связанные привычки могут попадать только привычки с признаком приятной привычки
+    if related_habit_id and related_is_pleasant is False:
+        errors["related_habit"] = "В связанные привычки могут попадать только приятные привычки"
+
+    # 3. У приятной привычки не может быть вознаграждения или связанной привычки
+    if is_pleasant:
+        if reward:
+            errors["reward"] = "У приятной привычки не может быть вознаграждения"
+        if related_habit_id:
+            errors["related_habit"] = "У приятной привычки не может быть связанной привычки"
+    # 4. Время выполнения полезной привычки не больше 120 секунд
+    elif duration is not None and duration > USEFUL_HABIT_MAX_DURATION:
+        errors["duration"] = "Время выполнения полезной привычки должно быть не больше 120 секунд"
+
+    # 5. Нельзя выполнять привычку реже, чем 1 раз в 7 дней
+    if frequency is not None and frequency > HABIT_MAX_FREQUENCY:
+        errors["frequency"] = "Нельзя выполнять привычку реже, чем 1 раз в 7 дней"
+
+    return errors
@@ -1,16 +1,41 @@
+import json
+import secrets
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import Http404
+from django.core.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DetailView, ListView, TemplateView
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics, permissions
-from rest_framework.filters import OrderingFilter
-
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from .conditional import get_not_modified_response, make_etag
+from .filters import StableOrderingFilter
+from .list_cache import bump_habit_list_version, get_cached_habit_list, get_habit_list_cache_key, set_cached_habit_list
+from .metrics import metrics, record_cache_lookup
 from .models import Habit
+from .pagination import HabitCursorPagination, PublicFeedPagination
 from .permissions import IsOwner
-from .serializers import HabitSerializer, PublicHabitSerializer
+from .public_feed import invalidate_public_feed
+from .serializers import (
+    HabitBulkItemSerializer,
+    HabitBulkSerializer,
+    HabitRowSerializer,
+    HabitSerializer,
+    PublicHabitRowSerializer,
+    PublicHabitSerializer
+)
 
 
 # API Views
@@ -19,13 +44,40 @@ class HabitListCreateView(generics.ListCreateAPIView):
 
     serializer_class = HabitSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    pagination_class = HabitCursorPagination
+    # По умолчанию курсор идет по индексу (user, -created_at, -id); ?ordering= добавляет к полю id для стабильности
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
     filterset_fields = ["is_pleasant", "is_public"]
     ordering_fields = ["time", "created_at"]
+    ordering = HabitCursorPagination.ordering
 
     def get_queryset(self):
         return Habit.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Страница списка из кэша; кэш сбрасывается сменой версии при любом изменении привычек пользователя.
+        ETag строится из того же ключа (версия + параметры), поэтому 304 отдается без обращения к странице и БД.
+        """
+        key = get_habit_list_cache_key(request)
+        etag = make_etag(key)
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        data = get_cached_habit_list(key)
+        record_cache_lookup("habit_list", hit=data is not None)
+        if data is not None:
+            response = Response(data)
+        else:
+            # Страница читается строками values() и сериализуется быстрым HabitRowSerializer
+            rows = self.paginate_queryset(HabitRowSerializer.get_rows(self.filter_queryset(self.get_queryset())))
+            response = self.get_paginated_response(HabitRowSerializer(rows, many=True).data)
+            set_cached_habit_list(key, response.data)
+
+        response["ETag"] = etag
+        return response
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
@@ -39,16 +91,196 @@ class HabitRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Habit.objects.filter(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Привычка с ETag по updated_at: при совпадении If-None-Match отвечаем 304 без сериализации.
+        related_habit входит в ETag отдельно: SET_NULL при удалении связанной привычки не меняет updated_at.
+        """
+        instance = self.get_object()
+        etag = make_etag("habit", instance.pk, instance.updated_at, instance.related_habit_id)
+
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(self.get_serializer(instance).data)
+        response["ETag"] = etag
+        return response
+
+
+class HabitBulkView(APIView):
+    """
+    API для пакетного создания, изменения и удаления своих привычек:
+    {"create": [...], "update": [{"id": ..., ...}], "delete": [id, ...]}.
+    Все элементы проверяются за один проход, запись идет одной транзакцией через bulk_create/bulk_update.
+    Если хотя бы один элемент не прошел проверку, ничего не сохраняется, а в ответе - ошибки по элементам.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    # Поля, которые пакетное изменение записывает в БД
+    UPDATE_FIELDS = [
+        "place",
+        "time",
+        "action",
+        "is_pleasant",
+        "related_habit",
+        "reward",
+        "frequency",
+        "duration",
+        "is_public",
+        "next_due_at",
+        "updated_at",
+    ]
+
+    def post(self, request):
+        bulk = HabitBulkSerializer(data=request.data)
+        bulk.is_valid(raise_exception=True)
+        create_items = bulk.validated_data["create"]
+        update_items = bulk.validated_data["update"]
+        delete_ids = bulk.validated_data["delete"]
+
+        own_habits, related_habits = self.load_habits(request.user, create_items, update_items, delete_ids)
+        context = {"request": request, "related_habits": related_habits}
+        errors = []
+
+        not_found = {"id": ["Привычка не найдена"]}
+
+        created = []
+        for index, item in enumerate(create_items):
+            habit = Habit(user=request.user)
+            item_errors = self.validate_item(habit, item, context, partial=False)
+            if item_errors:
+                errors.append({"operation": "create", "index": index, "errors": item_errors})
+            else:
+                created.append(habit)
+
+        updated = []
+        for index, item in enumerate(update_items):
+            habit = own_habits.get(item["id"])
+            item_errors = self.validate_item(habit, item, context, partial=True) if habit else not_found
+            if item_errors:
+                errors.append({"operation": "update", "index": index, "errors": item_errors})
+            else:
+                updated.append(habit)
+
+        for index, habit_id in enumerate(delete_ids):
+            if habit_id not in own_habits:
+                errors.append({"operation": "delete", "index": index, "errors": not_found})
+
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.write(created, updated, [own_habits[habit_id] for habit_id in delete_ids])
+
+        return Response(
+            {
+                "created": HabitSerializer(created, many=True).data,
+                "updated": HabitSerializer(updated, many=True).data,
+                "deleted": delete_ids,
+            }
+        )
+
+    def load_habits(self, user, create_items, update_items, delete_ids):
+        """
+        Одним запросом загружаем изменяемые/удаляемые привычки пользователя и все упомянутые связанные привычки.
+        Текущие связанные привычки изменяемых привычек приходят в том же запросе (select_related), чтобы правила
+        проверялись по памяти и для тех элементов, где related_habit не передан.
+        Возвращает (свои привычки по id, связанные привычки по id).
+        """
+        own_ids = {item["id"] for item in update_items} | set(delete_ids)
+        related_ids = set()
+        for item in [*create_items, *update_items]:
+            try:
+                related_ids.add(int(item["related_habit"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        habits = (
+            Habit.objects.select_related("related_habit").in_bulk(own_ids | related_ids)
+            if own_ids or related_ids
+            else {}
+        )
+        own_habits = {}
+        for habit_id in own_ids:
+            habit = habits.get(habit_id)
+            if habit is not None and habit.user_id == user.id:
+                # Пользователь уже загружен - не запрашиваем его для каждой привычки при пересчете расписания
+                habit.user = user
+                own_habits[habit_id] = habit
+
+        return own_habits, {habit_id: habits[habit_id] for habit_id in related_ids if habit_id in habits}
+
+    def validate_item(self, habit, data, context, partial):
+        """
+        Та же проверка, что у HabitSerializer + Habit.full_clean, но без запросов к БД на элемент:
+        правила проверяет HabitSerializer.validate через check_rules по загруженным связанным привычкам,
+        а Habit.clean с его SELECT признака связанной привычки не вызывается.
+        Изменения применяются к habit; возвращает ошибки элемента или None.
+        """
+        serializer = HabitBulkItemSerializer(habit if habit.pk else None, data=data, partial=partial, context=context)
+        if not serializer.is_valid():
+            return serializer.errors
+
+        for attr, value in serializer.validated_data.items():
+            setattr(habit, attr, value)
+
+        try:
+            # Существование user и related_habit уже проверено при загрузке, уникальных полей у привычки нет,
+            # а CHECK-ограничения повторяют check_rules
+            habit.clean_fields(exclude=["user", "related_habit"])
+        except DjangoValidationError as exc:
+            return serializers.as_serializer_error(exc)
+
+        return None
+
+    def write(self, created, updated, deleted):
+        """Запись всего пакета одной транзакцией"""
+        now = timezone.now()
+        for habit in created:
+            habit.refresh_next_due_at()
+        for habit in updated:
+            habit.refresh_next_due_at()
+            habit.updated_at = now
+
+        with transaction.atomic():
+            Habit.objects.bulk_create(created)
+            Habit.objects.bulk_update(updated, self.UPDATE_FIELDS)
+            if deleted:
+                Habit.objects.filter(id__in=[habit.id for habit in deleted]).delete()
+            # bulk-операции не вызывают Habit.save/delete, поэтому кэши сбрасываем сами
+            if any(habit.in_public_feed for habit in [*created, *updated, *deleted]):
+                invalidate_public_feed()
+            bump_habit_list_version(self.request.user.id)
+
+        for habit in [*created, *updated]:
+            habit._loaded_schedule = (habit.time, habit.frequency)
+            habit._loaded_is_public = habit.is_public
+
 
 class PublicHabitListView(generics.ListAPIView):
     """API для просмотра публичных привычек"""
 
     serializer_class = PublicHabitSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PublicFeedPagination
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
+    # Поля строк PublicHabitRowSerializer: курсор берет позицию из строки values(), а автор в ней - это имя
+    ordering_fields = ["id", "place", "time", "action", "frequency", "duration", "created_at"]
 
     def get_queryset(self):
         return Habit.objects.filter(is_public=True).exclude(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """Лента отдается из кэша без запросов к БД; нестандартная сортировка (?ordering=) идет в БД"""
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            # Имя автора аннотируется в том же запросе - без загрузки пользователя на каждую привычку
+            rows = self.paginate_queryset(PublicHabitRowSerializer.get_rows(self.filter_queryset(self.get_queryset())))
+            return self.get_paginated_response(PublicHabitRowSerializer(rows, many=True).data)
+
+        page = self.paginator.paginate_feed(request)
+        return self.get_paginated_response([entry["payload"] for entry in page])
+
 
 # HTML Views
 class HabitListView(LoginRequiredMixin, ListView):
@@ -80,7 +312,13 @@ class PublicHabitsHTMLView(LoginRequiredMixin, ListView):
     context_object_name = "habits"
 
     def get_queryset(self):
-        queryset = Habit.objects.filter(is_public=True).exclude(user=self.request.user)
+        # Автор и связанная привычка выводятся в карточке - загружаем их тем же запросом
+        queryset = (
+            Habit.objects.filter(is_public=True)
+            .exclude(user=self.request.user)
+            .select_related("user", "related_habit")
+            .order_by("-created_at", "-id")
+        )
 
         # Упрощенная фильтрация
         habit_type = self.request.GET.get("type")
@@ -182,3 +420,47 @@ class ToggleNotificationsView(LoginRequiredMixin, View):
         messages.success(request, f"🔔 Уведомления {status}")
 
         return redirect("habits:notifications")
+
+
+class MetricsView(View):
+    """
+    Метрики доставки напоминаний всех процессов (web и Celery) в формате Prometheus.
+    Доступны персоналу и сборщику метрик с токеном METRICS_TOKEN в заголовке Authorization: Bearer.
+    """
+
+    def has_token(self, request):
+        token = settings.METRICS_TOKEN
+        scheme, _, received = request.headers.get("Authorization", "").partition(" ")
+        return bool(token) and scheme.lower() == "bearer" and secrets.compare_digest(received.strip(), token)
+
+    def get(self, request):
+        if not (request.user.is_staff or self.has_token(request)):
+            raise Http404
+        return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class TelegramWebhookView(View):
+    """
+    Прием обновлений Telegram в режиме webhook.
+    Обновления обрабатываются параллельно в собственном event loop бота, поэтому view работает
+    и под WSGI (gunicorn config.wsgi), и под ASGI (config.asgi).
+    """
+
+    async def post(self, request):
+        from .telegram_bot import process_webhook_update
+
+        secret = settings.TELEGRAM_WEBHOOK_SECRET
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secret or not secrets.compare_digest(received, secret):
+            raise PermissionDenied
+
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest("Некорректный JSON")
+        if not isinstance(data, dict):
+            return HttpResponseBadRequest("Обновление Telegram должно быть JSON-объектом")
+
+        await process_webhook_update(data)
+        return HttpResponse()
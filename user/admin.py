@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from .models import User
@@ -10,10 +11,11 @@ class UserAdmin(BaseUserAdmin):
     list_filter = ("role", "is_blocked", "is_staff", "is_superuser")
     search_fields = ("username", "email")
     ordering = ("username",)
+    readonly_fields = ("updated_at",)
 
     fieldsets = (
         (None, {"fields": ("username", "password")}),
-        (_("Personal info"), {"fields": ("email", "country", "phone", "avatar")}),
+        (_("Personal info"), {"fields": ("email", "country", "phone", "avatar", "timezone")}),
         (_("Telegram settings"), {"fields": ("telegram_chat_id", "telegram_username", "telegram_notifications")}),
         (
             _("Permissions"),
@@ -30,7 +32,7 @@ class UserAdmin(BaseUserAdmin):
                 ),
             },
         ),
-        (_("Important dates"), {"fields": ("last_login", "date_joined")}),
+        (_("Important dates"), {"fields": ("last_login", "date_joined", "updated_at")}),
     )
 
     add_fieldsets = (
@@ -46,25 +48,25 @@ class UserAdmin(BaseUserAdmin):
     actions = ["block_users", "unblock_users", "make_managers", "make_regular_users"]
 
     def block_users(self, request, queryset):
-        queryset.update(is_blocked=True)
+        queryset.update(is_blocked=True, updated_at=timezone.now())
         self.message_user(request, "Выбранные пользователи заблокированы")
 
     block_users.short_description = "Заблокировать пользователей"
 
     def unblock_users(self, request, queryset):
-        queryset.update(is_blocked=False)
+        queryset.update(is_blocked=False, updated_at=timezone.now())
         self.message_user(request, "Выбранные пользователи разблокированы")
 
     unblock_users.short_description = "Разблокировать пользователей"
 
     def make_managers(self, request, queryset):
-        queryset.update(role="manager")
+        queryset.update(role="manager", updated_at=timezone.now())
         self.message_user(request, "Выбранные пользователи стали менеджерами")
 
     make_managers.short_description = "Сделать менеджерами"
 
     def make_regular_users(self, request, queryset):
-        queryset.update(role="user")
+        queryset.update(role="user", updated_at=timezone.now())
         self.message_user(request, "Выбранные пользователи стали обычными пользователями")
 
     make_regular_users.short_description = "Сделать обычными пользователями"
@@ -39,7 +39,7 @@ class UserRegistrationForm(UserCreationForm):
 class UserProfileForm(forms.ModelForm):
     class Meta:
         model = User
-        fields = ("username", "email", "country", "phone", "avatar")
+        fields = ("username", "email", "country", "phone", "avatar", "timezone")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
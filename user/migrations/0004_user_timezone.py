@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2025-10-18 15:02
+
+from django.db import migrations, models
+
+import user.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0003_user_telegram_chat_id_user_telegram_notifications_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="timezone",
+            field=models.CharField(
+                default="Europe/Moscow",
+                help_text="Часовой пояс, в котором указано время привычек (например, Europe/Moscow)",
+                max_length=63,
+                validators=[user.validators.validate_timezone],
+                verbose_name="Часовой пояс",
+            ),
+        ),
+    ]
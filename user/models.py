@@ -1,10 +1,12 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
-from django.db import models
+from django.db import models, transaction
 from phonenumber_field.modelfields import PhoneNumberField
 
 from config import settings
 
+from .validators import validate_timezone
+
 
 class User(AbstractUser):
     username = models.CharField(
@@ -71,13 +73,80 @@ class User(AbstractUser):
         default=True, verbose_name="Telegram уведомления", help_text="Включены ли уведомления в Telegram"
     )
 
+    timezone = models.CharField(
+        max_length=63,
+        default="Europe/Moscow",
+        validators=[validate_timezone],
+        verbose_name="Часовой пояс",
+        help_text="Часовой пояс, в котором указано время привычек (например, Europe/Moscow)",
+    )
+
     ROLES = (("user", "Пользователь"), ("manager", "Менеджер"))
     role = models.CharField(max_length=10, choices=ROLES, default="user", verbose_name="Роль")
     is_blocked = models.BooleanField(default=False, verbose_name="Заблокирован")
 
+    # Версия профиля для ETag в API
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженный часовой пояс, чтобы отследить его изменение при сохранении
+        instance._loaded_timezone = instance.__dict__.get("timezone")
+        instance._loaded_telegram_chat_id = instance.__dict__.get("telegram_chat_id")
+        instance._loaded_username = instance.__dict__.get("username")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        При смене часового пояса пересчитываем время следующих напоминаний о привычках,
+        сбрасываем кэш Telegram-бота для старого и нового chat_id,
+        а при смене имени автора публичных привычек - публичную ленту, где оно показывается
+        """
+        from habits.chat_cache import chat_user_cache
+
+        loaded_timezone = getattr(self, "_loaded_timezone", None)
+        super().save(*args, **kwargs)
+
+        if loaded_timezone is not None and loaded_timezone != self.timezone:
+            from habits.models import reschedule_habits
+
+            reschedule_habits(self.habits.all())
+        self._loaded_timezone = self.timezone
+
+        chat_user_cache.invalidate(getattr(self, "_loaded_telegram_chat_id", None), self.telegram_chat_id)
+        self._loaded_telegram_chat_id = self.telegram_chat_id
+
+        loaded_username = getattr(self, "_loaded_username", None)
+        if loaded_username is not None and loaded_username != self.username and self.has_public_habits():
+            from habits.public_feed import invalidate_public_feed
+
+            invalidate_public_feed()
+        self._loaded_username = self.username
+
+    def delete(self, *args, **kwargs):
+        from habits.chat_cache import chat_user_cache
+        from habits.public_feed import invalidate_public_feed
+
+        chat_ids = (getattr(self, "_loaded_telegram_chat_id", None), self.telegram_chat_id)
+        # Привычки пользователя удаляются каскадом в БД, минуя Habit.delete
+        has_public_habits = self.has_public_habits()
+
+        # Кэши сбрасываются после удаления (и фиксации транзакции), иначе читатель успел бы закэшировать
+        # еще не удаленного пользователя заново
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: chat_user_cache.invalidate(*chat_ids))
+        if has_public_habits:
+            invalidate_public_feed()
+        return result
+
+    def has_public_habits(self):
+        """Показывается ли пользователь в публичной ленте"""
+        return self.habits.filter(is_public=True).exists()
+
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
@@ -27,6 +27,7 @@ class UserPrivateProfileSerializer(serializers.ModelSerializer):
             "city",
             "phone",
             "avatar",
+            "timezone",
             "role",
             "is_blocked",
             "is_verified",
@@ -48,6 +49,7 @@ class UserApiRegistrationSerializer(serializers.ModelSerializer):
             "city",
             "phone",
             "avatar",
+            "timezone",
         ]
 
     def validate_username(self, value):
@@ -1 +1,140 @@
-# Create your tests here.
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from habits.models import Habit
+
+from .models import User
+from .validators import get_available_timezones, validate_timezone
+
+PASSWORD = "QueryCheck-123"
+
+
+def make_user(name, **extra):
+    user = User(username=name, email=f"{name}@example.com", **extra)
+    user.set_password(PASSWORD)
+    user.save()
+    return user
+
+
+class UserApiQueryCountTests(TestCase):
+    """
+    Число запросов к БД на каждый API-эндпоинт пользователей.
+    В число входит загрузка пользователя JWT-аутентификацией (1 запрос).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("owner")
+        cls.manager = make_user("manager", role="manager")
+        cls.other = make_user("other")
+        # Лишние пользователи в списке не должны добавлять запросов
+        for i in range(10):
+            make_user(f"extra_{i}")
+
+    def request(self, user, method, url, data=None):
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"} if user else {}
+        response = getattr(self.client, method)(url, data, content_type="application/json", headers=headers)
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def assert_queries(self, count, user, method, url, data=None):
+        with self.assertNumQueries(count):
+            return self.request(user, method, url, data)
+
+    def test_user_list(self):
+        self.assert_queries(3, self.manager, "get", reverse("user:api_user_list"))
+
+    def test_own_profile(self):
+        self.assert_queries(1, self.owner, "get", reverse("user:api_my_profile"))
+        self.assert_queries(1, self.owner, "get", reverse("user:api_profile_detail", args=[self.owner.pk]))
+
+    def test_other_profile(self):
+        url = reverse("user:api_profile_detail", args=[self.other.pk])
+        self.assert_queries(2, self.owner, "get", url)
+        self.assert_queries(2, self.manager, "get", url)
+
+    def test_profile_update(self):
+        self.assert_queries(2, self.owner, "patch", reverse("user:api_my_profile_update"), {"city": "Москва"})
+        url = reverse("user:api_profile_update_detail", args=[self.other.pk])
+        self.assert_queries(3, self.manager, "patch", url, {"city": "Казань"})
+
+    def test_tokens(self):
+        data = {User.USERNAME_FIELD: self.owner.get_username(), "password": PASSWORD}
+        self.assert_queries(1, None, "post", reverse("user:token_obtain_pair"), data)
+        data = {"refresh": str(RefreshToken.for_user(self.owner))}
+        self.assert_queries(1, None, "post", reverse("user:token_refresh"), data)
+
+    def test_register(self):
+        data = {"username": "new", "email": "new@example.com", "password": PASSWORD}
+        self.assert_queries(5, None, "post", reverse("user:user_api_register"), data)
+
+
+class TimezoneValidatorTests(TestCase):
+    """Часовой пояс пользователя проверяется по базе IANA, которая читается один раз"""
+
+    def test_known_and_unknown_timezones(self):
+        validate_timezone("America/New_York")
+        with self.assertRaises(ValidationError):
+            validate_timezone("Mars/Olympus")
+
+    def test_tzdata_is_scanned_once(self):
+        get_available_timezones.cache_clear()
+        with mock.patch("user.validators.available_timezones", return_value={"Asia/Tokyo"}) as available:
+            validate_timezone("Asia/Tokyo")
+            validate_timezone("Asia/Tokyo")
+        get_available_timezones.cache_clear()
+
+        available.assert_called_once()
+
+
+class UserDeleteInvalidationTests(TestCase):
+    """Кэши бота и публичной ленты сбрасываются после удаления пользователя, а не до него"""
+
+    def test_caches_are_invalidated_after_delete(self):
+        user = make_user("deleted", telegram_chat_id=800)
+        Habit.objects.create(user=user, place="Дом", time="08:00", action="Зарядка", duration=60, is_public=True)
+
+        def user_exists(*args):
+            seen.append(User.objects.filter(pk=user.pk).exists())
+
+        seen = []
+        with (
+            mock.patch("habits.chat_cache.chat_user_cache.invalidate", side_effect=user_exists) as invalidate,
+            mock.patch("habits.public_feed.invalidate_public_feed", side_effect=user_exists) as invalidate_feed,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            user.delete()
+
+        invalidate.assert_called_once_with(800, 800)
+        invalidate_feed.assert_called_once()
+        self.assertEqual(seen, [False, False])
+
+
+class ProfileETagTests(TestCase):
+    """Профиль отдается с ETag: 304 при совпадении If-None-Match, новый ETag после изменения"""
+
+    def test_profile_etag(self):
+        user = make_user("etag")
+        self.client.force_login(user)
+        url = reverse("user:api_my_profile")
+
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.patch(
+            reverse("user:api_my_profile_update"), {"city": "Москва"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        other_url = reverse("user:api_profile_detail", args=[make_user("other").pk])
+        etag = self.client.get(other_url)["ETag"]
+        self.assertEqual(self.client.get(other_url, headers={"If-None-Match": etag}).status_code, 304)
@@ -0,0 +1,19 @@
+from functools import cache
+from zoneinfo import available_timezones
+
+from django.core.exceptions import ValidationError
+
+
+@cache
+def get_available_timezones():
+    """Названия часовых поясов IANA; available_timezones() каждый раз заново обходит tzdata, поэтому кэшируем"""
+    return frozenset(available_timezones())
+
+
+def validate_timezone(value):
+    """Валидатор часового пояса (название из базы IANA, например Europe/Moscow)"""
+    if value not in get_available_timezones():
+        raise ValidationError(
+            "Неизвестный часовой пояс. Укажите название из базы IANA, например Europe/Moscow",
+            params={"value": value},
+        )
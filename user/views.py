@@ -14,6 +14,9 @@ from django.views.decorators.cache import cache_page
 from django.views.generic import CreateView, ListView, TemplateView, UpdateView
 from rest_framework import generics, permissions
 from rest_framework.exceptions import PermissionDenied as DRFPermissionDenied
+from rest_framework.response import Response
+
+from habits.conditional import get_not_modified_response, make_etag
 
 from .forms import UserProfileForm, UserRegistrationForm
 from .mixins import ManagerRequiredMixin
@@ -167,6 +170,8 @@ class UserProfileRetrieveAPIView(generics.RetrieveAPIView):
     """
 
     permission_classes = [permissions.IsAuthenticated]
+    # Целевой пользователь запроса: определяется один раз, его используют и get_serializer_class, и retrieve
+    _target_user = None
 
     def get_serializer_class(self):
         target_user = self.get_object()
@@ -186,10 +191,28 @@ class UserProfileRetrieveAPIView(generics.RetrieveAPIView):
         return UserPublicProfileSerializer
 
     def get_object(self):
-        user_id = self.kwargs.get("pk")
-        if user_id:
-            return generics.get_object_or_404(User, pk=user_id)
-        return self.request.user
+        """Пользователь из URL (или текущий) с мемоизацией; свой профиль по pk не требует запроса к БД"""
+        if self._target_user is None:
+            user_id = self.kwargs.get("pk")
+            if user_id and user_id != self.request.user.pk:
+                self._target_user = generics.get_object_or_404(User, pk=user_id)
+            else:
+                self._target_user = self.request.user
+        return self._target_user
+
+    def retrieve(self, request, *args, **kwargs):
+        """Профиль с ETag: при совпадении If-None-Match отвечаем 304 без сериализации"""
+        instance = self.get_object()
+        serializer_class = self.get_serializer_class()
+        etag = make_etag("user", instance.pk, instance.updated_at, serializer_class.__name__, request.get_host())
+
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(serializer_class(instance, context=self.get_serializer_context()).data)
+        response["ETag"] = etag
+        return response
 
 
 class UserListAPIView(generics.ListAPIView):